@@ -0,0 +1,92 @@
+"""
+Async login and signup views for ASGI deployments, routed instead of
+the synchronous ones when POLLS_ASYNC_VIEWS is on. Passwords are hashed
+and checked in the bounded thread pool of hashing.py.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import login as auth_login
+from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
+from django.core.exceptions import ValidationError
+from django.http import HttpResponseRedirect
+from django.shortcuts import redirect, render, resolve_url
+from django.utils.http import url_has_allowed_host_and_scheme
+
+from . import hashing
+
+
+class PooledAuthenticationForm(AuthenticationForm):
+    """
+    AuthenticationForm that checks the password in the hashing pool:
+    await ais_valid() instead of calling is_valid().
+    """
+
+    def clean(self):
+        # The credentials are checked by ais_valid()
+        return self.cleaned_data
+
+    async def ais_valid(self) -> bool:
+        if not self.is_valid():
+            return False
+        self.user_cache = await hashing.aauthenticate(
+            self.request,
+            self.cleaned_data['username'],
+            self.cleaned_data['password'],
+        )
+        try:
+            if self.user_cache is None:
+                raise self.get_invalid_login_error()
+            self.confirm_login_allowed(self.user_cache)
+        except ValidationError as error:
+            self.add_error(None, error)
+            return False
+        return True
+
+
+def _redirect_url(request) -> str:
+    """The safe `next` URL of a login request, like LoginView's."""
+    url = request.POST.get('next', request.GET.get('next', ''))
+    if url_has_allowed_host_and_scheme(
+        url, allowed_hosts={request.get_host()},
+        require_https=request.is_secure(),
+    ):
+        return url
+    return ''
+
+
+async def login(request):
+    """Log a user in."""
+    next_url = _redirect_url(request)
+    if request.method == 'POST':
+        form = PooledAuthenticationForm(request, data=request.POST)
+        if await form.ais_valid():
+            await sync_to_async(auth_login)(request, form.get_user())
+            return HttpResponseRedirect(
+                next_url or resolve_url(settings.LOGIN_REDIRECT_URL)
+            )
+    else:
+        form = PooledAuthenticationForm(request)
+    return await sync_to_async(render)(request, 'registration/login.html', {
+        'form': form,
+        'next': next_url,
+    })
+
+
+async def signup(request):
+    """Register a new user."""
+    if request.method == 'POST':
+        form = UserCreationForm(request.POST)
+        if await sync_to_async(form.is_valid)():
+            user = form.instance
+            user.password = await hashing.amake_password(
+                form.cleaned_data['password1']
+            )
+            await user.asave()
+            await sync_to_async(auth_login)(
+                request, user, backend=hashing.MODEL_BACKEND
+            )
+        return redirect('polls:index')
+    form = UserCreationForm()
+    return await sync_to_async(render)(
+        request, 'registration/signup.html', {'form': form}
+    )
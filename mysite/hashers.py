@@ -0,0 +1,44 @@
+"""
+Password hashers whose cost is read from the settings.
+
+They keep the algorithm names of Django's hashers, so stored hashes stay
+valid. When PASSWORD_HASHER or a cost setting changes, a password is
+rehashed with the new choice at the user's next login.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 with PASSWORD_PBKDF2_ITERATIONS iterations."""
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    """scrypt with a work factor of PASSWORD_SCRYPT_WORK_FACTOR."""
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """
+    Argon2id with PASSWORD_ARGON2_TIME_COST passes over
+    PASSWORD_ARGON2_MEMORY_COST KiB of memory (needs argon2-cffi).
+    """
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
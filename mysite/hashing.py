@@ -0,0 +1,88 @@
+"""
+Password hashing off the request threads, for the async (ASGI) login and
+signup views.
+
+Hashing a password is slow on purpose and CPU-bound. On the event loop it
+would stall every request of the worker, and through sync_to_async it
+would hold the one thread that runs the synchronous parts of all
+requests. Here it runs in a pool of PASSWORD_HASHING_THREADS threads:
+a burst of logins and signups waits for a free thread while votes are
+still served. hashlib releases the GIL while it hashes, so the threads
+run on separate cores.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model, user_login_failed
+from django.contrib.auth.hashers import check_password, make_password
+
+MODEL_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the hashing thread pool of this process."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PASSWORD_HASHING_THREADS,
+                thread_name_prefix='password-hashing',
+            )
+        return _executor
+
+
+async def _run(function, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), function, *args)
+
+
+async def amake_password(password) -> str:
+    """Hash `password` with the preferred hasher in the pool."""
+    return await _run(make_password, password)
+
+
+async def acheck_password(user, password) -> bool:
+    """
+    Check `password` against the hash of `user` in the pool, and store a
+    new hash if it was made with an outdated hasher or cost.
+    """
+    outdated = []
+    correct = await _run(
+        check_password, password, user.password, outdated.append
+    )
+    if correct and outdated:
+        user.password = await amake_password(password)
+        await user.asave(update_fields=['password'])
+    return correct
+
+
+async def aauthenticate(request, username, password):
+    """
+    Return the active user with these credentials or None, like
+    authenticate() with the ModelBackend but hashing in the pool.
+    """
+    UserModel = get_user_model()
+    try:
+        user = await UserModel._default_manager.aget(
+            **{UserModel.USERNAME_FIELD: username}
+        )
+    except UserModel.DoesNotExist:
+        # Hash anyway, so that unknown usernames take as long to reject
+        await amake_password(password)
+        user = None
+    else:
+        if not (await acheck_password(user, password) and user.is_active):
+            user = None
+    if user is None:
+        user_login_failed.send(
+            sender=__name__, credentials={'username': username},
+            request=request,
+        )
+        return None
+    user.backend = MODEL_BACKEND
+    return user
@@ -0,0 +1,208 @@
+"""
+Request instrumentation: SQL counts and timings, template render time,
+duplicated SQL (the signature of an N+1), Server-Timing headers, a slow
+request log and rolling latency histograms per URL name.
+"""
+import json
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async,
+)
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('mysite.requests')
+
+# Upper bounds (ms) of the latency histogram buckets; the last is open.
+BUCKET_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class QueryRecorder:
+    """Database execute wrapper that counts, times and groups queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def duplicates(self) -> int:
+        """Number of queries that repeated an earlier statement."""
+        return sum(n - 1 for n in self.statements.values() if n > 1)
+
+    def most_duplicated(self):
+        """Return (sql, times) of the most repeated statement, or None."""
+        if not self.duplicates:
+            return None
+        return self.statements.most_common(1)[0]
+
+
+class RollingHistograms:
+    """
+    Latency histograms per URL name over the last few time windows.
+    Old windows are dropped as time moves on, so the dump describes
+    recent traffic only.
+    """
+
+    def __init__(self, window_seconds=60, windows=15):
+        self.window_seconds = window_seconds
+        self.windows = deque(maxlen=windows)
+        self.lock = threading.Lock()
+
+    def _current_window(self, now):
+        start = now - now % self.window_seconds
+        if not self.windows or self.windows[-1][0] != start:
+            self.windows.append((start, {}))
+        return self.windows[-1][1]
+
+    def record(self, name, duration_ms, queries):
+        with self.lock:
+            stats = self._current_window(time.time()).setdefault(name, {
+                'count': 0, 'total_ms': 0.0, 'queries': 0,
+                'buckets': [0] * (len(BUCKET_BOUNDS_MS) + 1),
+            })
+            stats['count'] += 1
+            stats['total_ms'] += duration_ms
+            stats['queries'] += queries
+            for index, bound in enumerate(BUCKET_BOUNDS_MS):
+                if duration_ms <= bound:
+                    break
+            else:
+                index = len(BUCKET_BOUNDS_MS)
+            stats['buckets'][index] += 1
+
+    def dump(self) -> dict:
+        """Return the histograms of all kept windows merged per name."""
+        oldest = time.time() - self.window_seconds * self.windows.maxlen
+        merged = {}
+        with self.lock:
+            for start, window in self.windows:
+                if start < oldest:
+                    continue
+                for name, stats in window.items():
+                    total = merged.setdefault(name, {
+                        'count': 0, 'total_ms': 0.0, 'queries': 0,
+                        'buckets': [0] * (len(BUCKET_BOUNDS_MS) + 1),
+                    })
+                    total['count'] += stats['count']
+                    total['total_ms'] += stats['total_ms']
+                    total['queries'] += stats['queries']
+                    total['buckets'] = [
+                        a + b for a, b in zip(total['buckets'], stats['buckets'])
+                    ]
+        for stats in merged.values():
+            stats['mean_ms'] = stats['total_ms'] / stats['count']
+            stats['mean_queries'] = stats['queries'] / stats['count']
+            stats['bucket_bounds_ms'] = list(BUCKET_BOUNDS_MS) + [None]
+        return merged
+
+
+histograms = RollingHistograms()
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure every request: queries and SQL time on all database
+    connections, template render time of TemplateResponses and total
+    time. Adds a Server-Timing header, logs requests slower than
+    SLOW_REQUEST_MS as one JSON line and feeds the rolling histograms.
+    Under ASGI it stays asynchronous, so async views are not moved to a
+    thread on its account.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _record_queries(stack, recorder):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        request.template_ms = None
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            self._record_queries(stack, recorder)
+            response = self.get_response(request)
+        return self._report(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        request.template_ms = None
+        started = time.perf_counter()
+        # Connections belong to the thread that runs the synchronous parts
+        # of the request (the ORM included), so wrap them from that thread
+        stack = ExitStack()
+        await sync_to_async(self._record_queries)(stack, recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self._report(request, response, recorder, started)
+
+    def _report(self, request, response, recorder, started):
+        duration_ms = (time.perf_counter() - started) * 1000
+        db_ms = recorder.seconds * 1000
+
+        match = request.resolver_match
+        name = match.view_name if match else '<unresolved>'
+        histograms.record(name, duration_ms, recorder.count)
+
+        if settings.SERVER_TIMING_HEADER:
+            timings = [
+                f'db;dur={db_ms:.1f};desc="{recorder.count} queries"',
+                f'total;dur={duration_ms:.1f}',
+            ]
+            if request.template_ms is not None:
+                timings.insert(1, f'tpl;dur={request.template_ms:.1f}')
+            response['Server-Timing'] = ', '.join(timings)
+
+        if duration_ms >= settings.SLOW_REQUEST_MS:
+            duplicated = recorder.most_duplicated()
+            logger.warning(json.dumps({
+                'event': 'slow_request',
+                'method': request.method,
+                'path': request.path,
+                'url_name': name,
+                'status': response.status_code,
+                'duration_ms': round(duration_ms, 1),
+                'db_ms': round(db_ms, 1),
+                'template_ms': (
+                    None if request.template_ms is None
+                    else round(request.template_ms, 1)
+                ),
+                'queries': recorder.count,
+                'duplicate_queries': recorder.duplicates,
+                'most_duplicated_sql': duplicated[0] if duplicated else None,
+            }))
+        return response
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+
+        def record_render_time(rendered):
+            request.template_ms = (time.perf_counter() - started) * 1000
+
+        response.add_post_render_callback(record_render_time)
+        return response
@@ -0,0 +1,180 @@
+"""
+Static asset pipeline: content-hashed file names, precompressed
+variants and an in-process server for deployments without nginx.
+
+collectstatic copies every asset under a name that contains a hash of
+its content (style.css -> style.1a2b3c4d5e6f.css) and writes gzip and,
+when the brotli package is installed, brotli variants next to the text
+assets. A hashed name changes whenever the content does, so browsers
+may cache it for a year without revalidating. StaticFilesMiddleware
+serves STATIC_ROOT with those headers, picking the variant the client
+accepts.
+"""
+import gzip
+import mimetypes
+import os
+import re
+
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async,
+)
+from django.conf import settings
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage, staticfiles_storage,
+)
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Assets worth compressing, and the smallest size that pays off
+COMPRESSIBLE = ('.css', '.js', '.svg', '.txt', '.html', '.json', '.map')
+MIN_COMPRESS_SIZE = 256
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=60'
+
+
+def compress(path) -> list:
+    """
+    Write the gzip and brotli variants of the file at `path` that are
+    smaller than it, and return their paths.
+    """
+    with open(path, 'rb') as source:
+        content = source.read()
+    if len(content) < MIN_COMPRESS_SIZE:
+        return []
+    variants = [('.gz', lambda data: gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress))
+    written = []
+    for suffix, compressor in variants:
+        compressed = compressor(content)
+        if len(compressed) < len(content):
+            with open(path + suffix, 'wb') as target:
+                target.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that also precompresses the collected text
+    assets. Until collectstatic has written a manifest, it falls back to
+    the plain names instead of failing.
+    """
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(paths) | set(self.hashed_files.values()):
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                compress(self.path(name))
+
+
+class StaticFilesMiddleware:
+    """
+    Serve files collected in STATIC_ROOT when SERVE_STATIC is on, for
+    deployments with no web server in front of Django. Hashed names are
+    cached for a year as immutable; others are revalidated by date.
+    A precompressed variant is served when Accept-Encoding allows it.
+    Files are returned as FileResponse, which WSGI servers such as
+    gunicorn send with sendfile(). Under ASGI the file system is read in
+    a thread, while other requests go on down the async handler chain.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SERVE_STATIC:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.prefix = settings.STATIC_URL
+        self.root = str(settings.STATIC_ROOT)
+        self.hashed_names = set(staticfiles_storage.hashed_files.values())
+
+    def static_name(self, request):
+        """Return the name of the static file requested, or None."""
+        if (request.method in ('GET', 'HEAD')
+                and request.path_info.startswith(self.prefix)):
+            return request.path_info[len(self.prefix):]
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        name = self.static_name(request)
+        if name is not None:
+            response = self.serve(request, name)
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        name = self.static_name(request)
+        if name is not None:
+            response = await sync_to_async(self.serve)(request, name)
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+    def serve(self, request, name):
+        """Return the response for the static file `name`, or None."""
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        immutable = name in self.hashed_names
+        if not immutable and not was_modified_since(
+            request.headers.get('If-Modified-Since'), stat.st_mtime
+        ):
+            return HttpResponseNotModified()
+
+        content_type = (
+            mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        )
+        encoding = self.pick_encoding(request, path)
+        response = FileResponse(
+            open(path + encoding[1], 'rb'), content_type=content_type
+        )
+        del response['Content-Disposition']
+        if encoding[0]:
+            response['Content-Encoding'] = encoding[0]
+        response['Vary'] = 'Accept-Encoding'
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = IMMUTABLE if immutable else REVALIDATE
+        return response
+
+    @staticmethod
+    def pick_encoding(request, path):
+        """
+        Return the (Content-Encoding, file suffix) of the best variant of
+        `path` that the client accepts: brotli, then gzip, then none.
+        """
+        accepted = {
+            token.split(';')[0].strip()
+            for token in request.headers.get('Accept-Encoding', '').split(',')
+            if not re.search(r';\s*q=0(\.0*)?\s*$', token)
+        }
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if encoding in accepted and os.path.isfile(path + suffix):
+                return encoding, suffix
+        return '', ''
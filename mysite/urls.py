@@ -14,10 +14,11 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 from django.views.generic import RedirectView
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path(
@@ -26,6 +27,19 @@ urlpatterns = [
     ),
     path('polls/', include('polls.urls')),
     path('admin/', admin.site.urls),
+]
+
+if settings.POLLS_ASYNC_VIEWS:
+    urlpatterns += [
+        path('accounts/login/', async_views.login, name='login'),
+        path('signup/', async_views.signup, name='signup'),
+    ]
+else:
+    urlpatterns += [
+        path('signup/', views.signup, name='signup'),
+    ]
+
+urlpatterns += [
     path('accounts/', include('django.contrib.auth.urls')),
-    path('signup/', views.signup, name='signup'),
+    path('metrics/requests/', views.request_metrics, name='request-metrics'),
 ]
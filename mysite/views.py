@@ -1,6 +1,13 @@
+import os
+
 from django.shortcuts import render, redirect
-from django.contrib.auth import login, authenticate
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth import login
 from django.contrib.auth.forms import UserCreationForm
+from django.http import JsonResponse
+
+from . import hashing
+from .middleware import histograms
 
 
 def signup(request):
@@ -8,13 +15,10 @@ def signup(request):
     if request.method == 'POST':
         form = UserCreationForm(request.POST)
         if form.is_valid():
-            form.save()
-            # get named fields from the form data
-            username = form.cleaned_data.get('username')
-            # password input field is named 'password1'
-            raw_passwd = form.cleaned_data.get('password1')
-            user = authenticate(username=username, password=raw_passwd)
-            login(request, user)
+            # Log the new user in directly: authenticate() would hash the
+            # password a second time only to find the same user
+            user = form.save()
+            login(request, user, backend=hashing.MODEL_BACKEND)
         return redirect('polls:index')
         # what if form is not valid?
         # we should display a message in signup.html
@@ -22,3 +26,12 @@ def signup(request):
         # create a user form and display it the signup page
         form = UserCreationForm()
     return render(request, 'registration/signup.html', {'form': form})
+
+
+@staff_member_required
+def request_metrics(request):
+    """Dump the rolling request histograms of this worker process."""
+    return JsonResponse({
+        'pid': os.getpid(),
+        'histograms': histograms.dump(),
+    })
@@ -1,11 +1,45 @@
+from urllib.parse import urlencode
+
+from django import forms
 from django.contrib import admin
+from django.db.models import Case, CharField, Value, When
+from django.http import HttpResponseRedirect
+from django.urls import reverse
+from django.utils import timezone
 
-from .models import Choice, Question
+from .models import Choice, Question, Vote
+from .pagination import EstimatedCountPaginator
 
 
 class ChoiceInline(admin.TabularInline):
     model = Choice
     extra = 3
+    # Stored counter plus any counter shards, loaded with the choices
+    readonly_fields = ['vote_count']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).tallied()
+
+    # Not named after the Choice.votes field, which the admin would show
+    @admin.display(description='votes')
+    def vote_count(self, choice) -> int:
+        return getattr(choice, 'tally', choice.votes)
+
+
+class StatusFilter(admin.SimpleListFilter):
+    """Filter questions with the QuestionQuerySet status filters."""
+    title = 'status'
+    parameter_name = 'status'
+
+    def lookups(self, request, model_admin):
+        return [
+            ('open', 'Open'), ('closed', 'Closed'), ('upcoming', 'Upcoming'),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value() in ('open', 'closed', 'upcoming'):
+            return getattr(queryset, self.value())()
+        return queryset
 
 
 class QuestionAdmin(admin.ModelAdmin):
@@ -15,11 +49,106 @@ class QuestionAdmin(admin.ModelAdmin):
             'fields': ['pub_date', 'end_date'],
             'classes': ['collapse']
         }),
+        ('Vote counting', {
+            'fields': ['counter_shards'],
+            'classes': ['collapse']
+        }),
     ]
     inlines = [ChoiceInline]
-    list_display = ('question_text', 'pub_date', 'was_published_recently')
-    list_filter = ['pub_date']
+    list_display = (
+        'question_text', 'pub_date', 'end_date', 'status', 'vote_total'
+    )
+    list_filter = [StatusFilter, 'pub_date']
     search_fields = ['question_text']
+    actions = ['export_tallies', 'export_votes']
+
+    def get_queryset(self, request):
+        """
+        Annotate the status and the votes including counter shards, so
+        the changelist can show and sort them.
+        """
+        now = timezone.now()
+        return super().get_queryset(request).tallied().annotate(
+            status=Case(
+                When(pub_date__gt=now, then=Value('upcoming')),
+                When(end_date__lt=now, then=Value('closed')),
+                default=Value('open'),
+                output_field=CharField(),
+            )
+        )
+
+    @admin.display(ordering='status')
+    def status(self, question) -> str:
+        return question.status
+
+    # Not named after the Question.total_votes field, which the admin
+    # would show and sort by instead
+    @admin.display(ordering='tally', description='total votes')
+    def vote_total(self, question) -> int:
+        return question.tally
+
+    def _export(self, url_name, queryset):
+        query = urlencode([
+            ('question', pk) for pk in queryset.values_list('pk', flat=True)
+        ])
+        return HttpResponseRedirect(f"{reverse(url_name)}?{query}")
+
+    @admin.action(description="Export vote tallies as CSV")
+    def export_tallies(self, request, queryset):
+        return self._export('polls:export-tallies', queryset)
+
+    @admin.action(description="Export raw votes as CSV")
+    def export_votes(self, request, queryset):
+        return self._export('polls:export-votes', queryset)
+
+
+class VoteForm(forms.ModelForm):
+    class Meta:
+        model = Vote
+        fields = ['user', 'choice']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        choice = cleaned_data.get('choice')
+        if (self.instance.pk and choice
+                and choice.question_id != self.instance.question_id):
+            raise forms.ValidationError(
+                "A vote can only move to a choice of the same question."
+            )
+        return cleaned_data
+
+
+class VoteAdmin(admin.ModelAdmin):
+    """
+    Votes, listed without loading the users or choices row by row and
+    paged without counting a large table. Votes are saved with
+    Vote.objects.cast() to keep the counters right, and cannot be
+    deleted here for the same reason.
+    """
+    form = VoteForm
+    list_display = ('id', 'user', 'question', 'choice', 'created', 'updated')
+    list_select_related = ['user', 'question', 'choice']
+    autocomplete_fields = ['user']
+    raw_id_fields = ['choice']
+    readonly_fields = ['question', 'created', 'updated']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is not None:
+            return ['user', *self.readonly_fields]
+        return self.readonly_fields
+
+    def save_model(self, request, obj, form, change):
+        Vote.objects.cast(obj.user, obj.choice)
+        obj.pk = Vote.objects.get(
+            user=obj.user, question_id=obj.choice.question_id
+        ).pk
+        obj.refresh_from_db()
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 admin.site.register(Question, QuestionAdmin)
+admin.site.register(Vote, VoteAdmin)
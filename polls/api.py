@@ -0,0 +1,199 @@
+"""
+JSON read API for the poll list, poll details, live results and the
+timeline of votes.
+
+Every response carries a strong ETag built from the cache version of
+the question (or of INDEX for the list) and a Last-Modified time of its
+latest change. Both come from the fragment cache, so a conditional GET
+that still matches is answered with 304 before any table is read. Full
+bodies are cached like the HTML fragments and invalidated by the same
+version bumps.
+"""
+import json
+import time
+
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from . import cache, pagination, routers
+from .models import HOUR, MINUTE, Choice, Question, VoteRollup
+
+
+def _question_data(question) -> dict:
+    return {
+        'id': question.pk,
+        'question_text': question.question_text,
+        'pub_date': question.pub_date,
+        'end_date': question.end_date,
+        'can_vote': question.can_vote(),
+        'url': reverse('polls:api-detail', args=(question.pk,)),
+        'results_url': reverse('polls:api-results', args=(question.pk,)),
+        'timeline_url': reverse('polls:api-timeline', args=(question.pk,)),
+    }
+
+
+def _published_question(pk):
+    try:
+        return Question.objects.published().get(pk=pk)
+    except Question.DoesNotExist:
+        raise Http404("No question found matching the query")
+
+
+def _conditional(request, kind, scope, build, variant='', rollover=None,
+                 public=True):
+    """
+    Answer a GET for the JSON document of `kind` about `scope`.
+    Returns 304 when the client's validators are still current and
+    otherwise the cached or freshly built (by `build()`) JSON body.
+    Documents that also change with time, as polls open and close, pass
+    a `rollover` period in seconds after which their tag changes anyway.
+    """
+    version, modified = cache.get_validators(scope)
+    etag = f'{kind}-{scope}-{version}'
+    if variant:
+        etag += f'-{variant}'
+    if rollover:
+        etag += f'-{int(time.time() // rollover)}'
+    etag = f'"{etag}"'
+    last_modified = int(modified)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        body = cache.get_or_render(
+            kind, scope,
+            lambda: json.dumps(build(), cls=DjangoJSONEncoder),
+            timeout=rollover, variant=variant,
+        )
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(
+        response, public=public, private=not public,
+        max_age=settings.POLLS_API_MAX_AGE,
+    )
+    return response
+
+
+@require_safe
+@routers.replica_reads
+def index(request):
+    """
+    List published questions, newest first, with the same cursor,
+    status and page size parameters as the index page.
+    """
+    page = pagination.index_page(request.GET, request.user)
+
+    def build():
+        return {
+            'polls': [_question_data(question) for question in page],
+            'next': (
+                reverse('polls:api-index') + '?' + page.next_query
+                if page.has_next else None
+            ),
+        }
+
+    return _conditional(
+        request, 'api_index', cache.INDEX, build,
+        variant=page.query,
+        rollover=settings.POLLS_INDEX_CACHE_TIMEOUT,
+        public=page.params.get('status') != 'upcoming',
+    )
+
+
+@require_safe
+@routers.replica_reads
+def detail(request, pk):
+    """Describe a published question and its choices."""
+
+    def build():
+        question = _published_question(pk)
+        return {
+            **_question_data(question),
+            'choices': list(Choice.objects.filter(
+                question_id=pk
+            ).order_by('pk').values('id', 'choice_text')),
+        }
+
+    return _conditional(
+        request, 'api_detail', cache.choices_scope(pk), build,
+        rollover=settings.POLLS_INDEX_CACHE_TIMEOUT,
+    )
+
+
+@require_safe
+@routers.replica_reads
+def results(request, pk):
+    """Report the vote counts of a published question."""
+
+    def build():
+        question = _published_question(pk)
+        choices = [
+            {'id': choice_id, 'choice_text': text, 'votes': votes}
+            for choice_id, text, votes in Choice.objects.filter(
+                question_id=pk
+            ).tallied().order_by('pk').values_list(
+                'id', 'choice_text', 'tally'
+            )
+        ]
+        return {
+            'id': question.pk,
+            'question_text': question.question_text,
+            # The sum of the choices includes votes still in shards
+            'total_votes': sum(choice['votes'] for choice in choices),
+            'choices': choices,
+        }
+
+    return _conditional(request, 'api_results', pk, build)
+
+
+# Bucket sizes of the timeline (?resolution=)
+RESOLUTIONS = {'hour': HOUR, 'minute': MINUTE}
+
+
+@require_safe
+@routers.replica_reads
+def timeline(request, pk):
+    """
+    Report how the votes of a published question changed over time, per
+    hour or, with ?resolution=minute, per minute for recent votes. Each
+    bucket has the net change in every choice's votes and the running
+    totals after it. Read from the rollups only, so a poll open for a
+    week is charted from at most 168 rows per choice.
+    """
+    name = request.GET.get('resolution', 'hour')
+    if name not in RESOLUTIONS:
+        raise BadRequest("Unknown timeline resolution.")
+
+    def build():
+        question = _published_question(pk)
+        choices = list(Choice.objects.filter(
+            question_id=pk
+        ).order_by('pk').values('id', 'choice_text'))
+        totals = {choice['id']: 0 for choice in choices}
+        buckets = []
+        for start, votes in VoteRollup.objects.timeline(
+            pk, RESOLUTIONS[name]
+        ):
+            for choice_id, delta in votes.items():
+                totals[choice_id] = totals.get(choice_id, 0) + delta
+            buckets.append({
+                'start': start,
+                'votes': votes,
+                'totals': dict(totals),
+            })
+        return {
+            'id': question.pk,
+            'question_text': question.question_text,
+            'resolution': name,
+            'choices': choices,
+            'buckets': buckets,
+        }
+
+    return _conditional(request, 'api_timeline', pk, build, variant=name)
@@ -0,0 +1,188 @@
+"""
+Async versions of the poll views for ASGI deployments.
+
+Database access uses Django's async ORM and fragments use the async
+cache API. Full pages are still rendered in a worker thread, because
+the context processors read the session and the user lazily.
+The views are routed instead of the ones in views.py when
+POLLS_ASYNC_VIEWS is on.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.http import (
+    Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse,
+)
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from . import cache, live, pagination, routers, tally, vote_queue
+from .models import Choice, Question, Vote
+
+
+async def _get_user(request):
+    """Load the lazy request.user in a thread, as it may hit the database."""
+    await sync_to_async(lambda: request.user.pk)()
+    return request.user
+
+
+async def _render(request, template_name, context):
+    return await sync_to_async(render)(request, template_name, context)
+
+
+@cache.shared_page
+@routers.replica_reads
+async def index(request):
+    """
+    Display the requested page of published questions, newest first.
+    """
+    user = None
+    if pagination.is_staff_only(request.GET):
+        user = await _get_user(request)
+    page = pagination.index_page(request.GET, user)
+
+    async def render_question_list():
+        await page.aload()
+        return render_to_string('polls/index_list.html', {
+            'latest_question_list': page,
+            'page': page,
+        })
+
+    question_list = await cache.aget_or_render(
+        'index', cache.INDEX, render_question_list,
+        timeout=settings.POLLS_INDEX_CACHE_TIMEOUT,
+        variant=page.query,
+    )
+    return await _render(request, 'polls/index.html', {
+        'latest_question_list': page,
+        'page': page,
+        'question_list': mark_safe(question_list),
+    })
+
+
+@cache.shared_page
+@routers.replica_reads
+async def detail(request, pk):
+    """
+    Display a published question with its choices.
+    """
+    try:
+        question = await Question.objects.filter(
+            pub_date__lte=timezone.now()
+        ).prefetch_related('choice_set').aget(pk=pk)
+    except Question.DoesNotExist:
+        raise Http404("No question found matching the query")
+
+    return await _render(request, 'polls/detail.html', {
+        'question': question,
+    })
+
+
+@cache.shared_page
+@routers.replica_reads
+async def results(request, pk):
+    """
+    Display the vote counts of a question.
+    """
+    choices = None
+    if settings.POLLS_SHARED_TALLY:
+        # The question from the cache and the counts from shared memory
+        question = await sync_to_async(tally.cached_question)(pk)
+        if question is None:
+            raise Http404("No question found matching the query")
+        choices = await sync_to_async(tally.tallied_choices)(question)
+    else:
+        try:
+            question = await Question.objects.aget(pk=pk)
+        except Question.DoesNotExist:
+            raise Http404("No question found matching the query")
+
+    async def render_results_table():
+        return render_to_string('polls/results_table.html', {
+            'choices': [
+                choice async for choice in question.choice_set.tallied()
+            ]
+        })
+
+    if choices is not None:
+        results_table = render_to_string(
+            'polls/results_table.html', {'choices': choices}
+        )
+    else:
+        results_table = await cache.aget_or_render(
+            'results', question.pk, render_results_table
+        )
+    live_url = None
+    if settings.POLLS_LIVE_RESULTS:
+        live_url = reverse('polls:results-live', args=(question.pk,))
+    return await _render(request, 'polls/results.html', {
+        'question': question,
+        'results_table': mark_safe(results_table),
+        'live_url': live_url,
+    })
+
+
+async def live_results(request, pk):
+    """
+    Stream the vote counts of a published question as Server-Sent
+    Events, or answer 503 when this worker serves too many streams.
+    """
+    if not await Question.objects.published().filter(pk=pk).aexists():
+        raise Http404("No question found matching the query")
+    broadcaster = live.get_broadcaster()
+    if broadcaster.full:
+        response = HttpResponse("Too many live connections.", status=503)
+        response['Retry-After'] = '30'
+        return response
+    response = StreamingHttpResponse(
+        live.stream(broadcaster, pk), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def vote(request, question_id):
+    """
+    Record the user's vote on a question.
+    Returns a redirect to the results page or
+    a rendering of the detail page with an error message.
+    """
+    user = await _get_user(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    try:
+        question = await Question.objects.aget(pk=question_id)
+    except Question.DoesNotExist:
+        raise Http404("No question found matching the query")
+    if not question.can_vote():
+        return await _render(request, 'polls/detail.html', {
+            'question': question,
+            'error_message': "This poll cannot be voted on at this time!!!"
+        })
+    try:
+        selected_choice = await question.choice_set.aget(
+            pk=request.POST['choice']
+        )
+    except (KeyError, Choice.DoesNotExist):
+        return await _render(request, 'polls/detail.html', {
+            'question': question,
+            'error_message': "You didn't select a choice.",
+        })
+
+    if settings.POLLS_VOTE_QUEUE:
+        await sync_to_async(vote_queue.enqueue)(
+            user.id, question.id, selected_choice.id
+        )
+    else:
+        await sync_to_async(Vote.objects.cast)(user, selected_choice)
+
+    messages.success(request, " Your vote has been recorded! ")
+    return HttpResponseRedirect(
+        reverse('polls:results', args=(question.id,))
+    )
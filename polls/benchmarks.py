@@ -0,0 +1,481 @@
+"""
+Query-count and latency benchmarks of the poll endpoints.
+
+seed() fills the database with synthetic polls and votes using bulk
+inserts, run() drives every endpoint through the test client and
+records its cost, and compare() checks a run against a stored baseline.
+The benchmark_polls command ties them together. index_pagination()
+compares keyset and offset paging of a large archive for
+benchmark_pagination, signup_throughput() measures the signups per
+second and core for benchmark_signup, and vote_round_trip() counts the
+database reads and writes of one vote for benchmark_sessions.
+"""
+import os
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection, connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import cache, pagination
+from .models import Choice, Question, Vote
+
+BENCH_USERNAME = 'bench'
+BENCH_PASSWORD = 'bench-password-1'
+
+# Metrics compared against the baseline. Query counts must not grow at
+# all; the others may grow by the tolerance given to compare().
+EXACT_METRICS = ('queries',)
+TOLERANT_METRICS = ('p50_ms', 'alloc_kb')
+
+
+def seed(questions=50, choices=4, users=100, votes=1000, batch_size=1000):
+    """
+    Insert synthetic questions, choices, users and votes in bulk and
+    return the benchmark user, who can log in with BENCH_PASSWORD.
+    """
+    now = timezone.now()
+    Question.objects.bulk_create([
+        Question(
+            question_text=f"Benchmark question {n}",
+            pub_date=now - timezone.timedelta(minutes=n),
+        )
+        for n in range(questions)
+    ], batch_size=batch_size)
+    question_ids = list(Question.objects.values_list('id', flat=True))
+    Choice.objects.bulk_create([
+        Choice(question_id=question_id, choice_text=f"Choice {n}")
+        for question_id in question_ids for n in range(choices)
+    ], batch_size=batch_size)
+
+    password = make_password(BENCH_PASSWORD)
+    User.objects.bulk_create([
+        User(username=f"bench-user-{n}", password=password)
+        for n in range(users)
+    ], batch_size=batch_size)
+    bench_user = User.objects.create_user(
+        username=BENCH_USERNAME, password=BENCH_PASSWORD
+    )
+
+    choices_of = {}
+    for choice_id, question_id in Choice.objects.values_list(
+        'id', 'question_id'
+    ):
+        choices_of.setdefault(question_id, []).append(choice_id)
+    user_ids = list(User.objects.exclude(
+        pk=bench_user.pk
+    ).values_list('id', flat=True))
+    rng = random.Random(0)
+    pairs = set()
+    attempts = 0
+    while len(pairs) < votes and attempts < votes * 10 and user_ids:
+        pairs.add((rng.choice(user_ids), rng.choice(question_ids)))
+        attempts += 1
+    new_votes = [
+        (user_id, question_id, rng.choice(choices_of[question_id]))
+        for user_id, question_id in pairs if choices_of.get(question_id)
+    ]
+    for start in range(0, len(new_votes), batch_size):
+        Vote.objects.cast_many(new_votes[start:start + batch_size])
+    return bench_user
+
+
+def percentile(values, fraction):
+    """Return the value at `fraction` (0..1) of the sorted `values`."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class QueryTimer:
+    """Database execute wrapper that counts and times every query."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+def measure(request, repeat):
+    """
+    Call `request(n)` `repeat` times after one warm-up call and return
+    the median query count, mean SQL time, latency percentiles and mean
+    peak allocation per call.
+    """
+    request(-1)
+    queries, sql_times, latencies, allocations = [], [], [], []
+    tracemalloc.start()
+    try:
+        for n in range(repeat):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            timer = QueryTimer()
+            with connection.execute_wrapper(timer):
+                started = time.perf_counter()
+                response = request(n)
+                latencies.append(time.perf_counter() - started)
+            allocations.append(tracemalloc.get_traced_memory()[1] - before)
+            if response.status_code >= 400:
+                raise RuntimeError(
+                    f"Benchmark request failed with {response.status_code}"
+                )
+            queries.append(timer.count)
+            sql_times.append(timer.seconds)
+    finally:
+        tracemalloc.stop()
+    return {
+        'queries': statistics.median(queries),
+        'sql_ms': statistics.mean(sql_times) * 1000,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p90_ms': percentile(latencies, 0.90) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'alloc_kb': statistics.mean(allocations) / 1024,
+    }
+
+
+def run(repeat=20):
+    """
+    Benchmark every endpoint against the seeded data and return the
+    results keyed by URL name.
+    """
+    cache.get_cache().clear()
+    question = Question.objects.filter(
+        pub_date__lte=timezone.now()
+    ).order_by('-pub_date').first()
+    choice_ids = list(question.choice_set.values_list('id', flat=True))
+    anonymous = Client()
+    member = Client()
+    member.login(username=BENCH_USERNAME, password=BENCH_PASSWORD)
+
+    detail_url = reverse('polls:detail', args=(question.id,))
+    results_url = reverse('polls:results', args=(question.id,))
+    vote_url = reverse('polls:vote', args=(question.id,))
+    login_url = reverse('login')
+    signup_url = reverse('signup')
+    run_id = time.time_ns()
+
+    endpoints = {
+        'polls:index': lambda n: anonymous.get(reverse('polls:index')),
+        'polls:detail': lambda n: member.get(detail_url),
+        'polls:results': lambda n: anonymous.get(results_url),
+        'polls:vote': lambda n: member.post(
+            vote_url, {'choice': choice_ids[n % len(choice_ids)]}
+        ),
+        'login': lambda n: Client().post(login_url, {
+            'username': BENCH_USERNAME, 'password': BENCH_PASSWORD,
+        }),
+        'signup': lambda n: Client().post(signup_url, {
+            'username': f"signup-{run_id}-{n}",
+            'password1': BENCH_PASSWORD,
+            'password2': BENCH_PASSWORD,
+        }),
+    }
+    return {
+        name: measure(request, repeat) for name, request in endpoints.items()
+    }
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Return a list of messages describing every metric in `results` that
+    regressed against `baseline`.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in EXACT_METRICS:
+            if metrics[metric] > previous[metric]:
+                regressions.append(
+                    f"{name} {metric}: {previous[metric]} -> {metrics[metric]}"
+                )
+        for metric in TOLERANT_METRICS:
+            if metrics[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{name} {metric}: {previous[metric]:.1f} -> "
+                    f"{metrics[metric]:.1f}"
+                )
+    return regressions
+
+
+def seed_questions(count, batch_size=10000):
+    """
+    Insert `count` questions published a second apart, two per second so
+    that pages have to break ties on id, with every third one closed.
+    """
+    now = timezone.now()
+    for start in range(0, count, batch_size):
+        questions = []
+        for n in range(start, min(start + batch_size, count)):
+            pub_date = now - timezone.timedelta(seconds=n // 2 + 1)
+            questions.append(Question(
+                question_text=f"Archived question {n}",
+                pub_date=pub_date,
+                end_date=(
+                    pub_date + timezone.timedelta(hours=1)
+                    if n % 3 == 0 else None
+                ),
+            ))
+        Question.objects.bulk_create(questions)
+
+
+def index_pagination(depths=(0, 100, 10000), page_size=20, repeat=20):
+    """
+    Time fetching the page `depth` pages deep through a keyset cursor
+    and through OFFSET, for each depth. Returns the query count and
+    median milliseconds of each method per depth.
+    """
+    ordered = Question.objects.published().order_by('-pub_date', '-id')
+    results = {}
+    for depth in depths:
+        cursor = None
+        if depth:
+            last_question = ordered[depth * page_size - 1]
+            cursor = pagination.encode_cursor(last_question)
+        methods = {
+            'keyset': lambda: pagination.paginate(
+                Question.objects.published(), cursor, page_size
+            ).rows,
+            'offset': lambda: list(
+                ordered[depth * page_size:(depth + 1) * page_size + 1]
+            ),
+        }
+        results[depth] = {}
+        for method, fetch in methods.items():
+            fetch()
+            timings = []
+            timer = QueryTimer()
+            with connection.execute_wrapper(timer):
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    fetch()
+                    timings.append(time.perf_counter() - started)
+            results[depth][method] = {
+                'queries': timer.count / repeat,
+                'median_ms': statistics.median(timings) * 1000,
+            }
+    return results
+
+
+def database_concurrency(alias, writers=4, readers=8, seconds=5.0):
+    """
+    Run `writers` threads that each record votes in short transactions
+    (one counter UPDATE and one INSERT) next to `readers` threads that
+    read the tallies, on the database `alias`, for `seconds`.
+    Returns the completed and failed operations per second of each kind.
+    """
+    with connections[alias].cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS bench_tally")
+        cursor.execute("DROP TABLE IF EXISTS bench_vote")
+        cursor.execute(
+            "CREATE TABLE bench_tally (id INTEGER PRIMARY KEY, n INTEGER)"
+        )
+        cursor.execute("CREATE TABLE bench_vote (tally_id INTEGER)")
+        for tally_id in range(10):
+            cursor.execute(
+                "INSERT INTO bench_tally (id, n) VALUES (%s, 0)", [tally_id]
+            )
+    counts = Counter()
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def write(rng, cursor):
+        tally_id = rng.randrange(10)
+        with transaction.atomic(using=alias):
+            cursor.execute(
+                "UPDATE bench_tally SET n = n + 1 WHERE id = %s", [tally_id]
+            )
+            cursor.execute(
+                "INSERT INTO bench_vote (tally_id) VALUES (%s)", [tally_id]
+            )
+
+    def read(rng, cursor):
+        cursor.execute("SELECT SUM(n) FROM bench_tally")
+        cursor.execute("SELECT COUNT(*) FROM bench_vote")
+
+    def worker(kind, operation, seed):
+        rng = random.Random(seed)
+        done = failed = 0
+        try:
+            with connections[alias].cursor() as cursor:
+                while time.perf_counter() < deadline:
+                    try:
+                        operation(rng, cursor)
+                        done += 1
+                    except OperationalError:
+                        failed += 1
+        finally:
+            connections[alias].close()
+        with lock:
+            counts[kind] += done
+            counts[f'{kind}_errors'] += failed
+
+    threads = [
+        threading.Thread(target=worker, args=('writes', write, n))
+        for n in range(writers)
+    ] + [
+        threading.Thread(target=worker, args=('reads', read, n))
+        for n in range(readers)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {kind: count / elapsed for kind, count in sorted(counts.items())}
+
+
+def vote_throughput(threads=8, seconds=5.0, shards=None):
+    """
+    Cast votes through Vote.objects.cast() from `threads` threads, each
+    with its own database connection, on the first seeded question for
+    `seconds`, after setting its counter_shards to `shards` if given.
+    Returns the votes and failed votes per second.
+    """
+    question = Question.objects.order_by('pk').first()
+    if shards is not None:
+        question.counter_shards = shards
+        question.save(update_fields=['counter_shards'])
+    choices = list(question.choice_set.all())
+    users = list(User.objects.all())
+    counts = Counter()
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(seed):
+        rng = random.Random(seed)
+        done = failed = 0
+        try:
+            while time.perf_counter() < deadline:
+                try:
+                    Vote.objects.cast(rng.choice(users), rng.choice(choices))
+                    done += 1
+                except OperationalError:
+                    failed += 1
+        finally:
+            connection.close()
+        with lock:
+            counts['votes'] += done
+            counts['errors'] += failed
+
+    workers = [
+        threading.Thread(target=worker, args=(n,)) for n in range(threads)
+    ]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {kind: count / elapsed for kind, count in counts.items()}
+
+
+def signup_throughput(threads=None, seconds=5.0):
+    """
+    Sign up new users through the signup view from `threads` threads
+    (one per core by default), each with its own database connection,
+    for `seconds`. Returns the signups per second, per second and core,
+    and the milliseconds one password hash takes.
+    """
+    cores = os.cpu_count() or 1
+    threads = threads or cores
+    started = time.perf_counter()
+    make_password(BENCH_PASSWORD)
+    hash_ms = (time.perf_counter() - started) * 1000
+    signup_url = reverse('signup')
+    run_id = time.time_ns()
+    counts = Counter()
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(number):
+        client = Client()
+        done = failed = 0
+        try:
+            while time.perf_counter() < deadline:
+                response = client.post(signup_url, {
+                    'username': f"signup-{run_id}-{number}-{done + failed}",
+                    'password1': BENCH_PASSWORD,
+                    'password2': BENCH_PASSWORD,
+                })
+                if response.status_code == 302:
+                    done += 1
+                else:
+                    failed += 1
+                client.logout()
+        finally:
+            connection.close()
+        with lock:
+            counts['signups'] += done
+            counts['errors'] += failed
+
+    workers = [
+        threading.Thread(target=worker, args=(n,)) for n in range(threads)
+    ]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    signups = User.objects.filter(
+        username__startswith=f"signup-{run_id}-"
+    ).count()
+    return {
+        'signups_per_s': signups / elapsed,
+        'signups_per_s_per_core': signups / elapsed / min(threads, cores),
+        'errors_per_s': counts['errors'] / elapsed,
+        'hash_ms': hash_ms,
+    }
+
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def vote_round_trip(repeat=20):
+    """
+    Log the benchmark user in, then vote on the first seeded question and
+    follow the redirect to its results `repeat` times. Returns the mean
+    queries and writes of one round trip, in total and on the session
+    table.
+    """
+    question = Question.objects.order_by('pk').first()
+    choice_ids = list(question.choice_set.values_list('id', flat=True))
+    vote_url = reverse('polls:vote', args=(question.id,))
+    client = Client()
+    client.login(username=BENCH_USERNAME, password=BENCH_PASSWORD)
+    counts = Counter()
+    for n in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(
+                vote_url, {'choice': choice_ids[n % len(choice_ids)]},
+                follow=True,
+            )
+        if response.status_code != 200:
+            raise RuntimeError(f"Vote failed with {response.status_code}")
+        for query in queries:
+            sql = query['sql'].lstrip().upper()
+            write = sql.startswith(WRITE_STATEMENTS)
+            session = 'DJANGO_SESSION' in sql
+            counts['queries'] += 1
+            counts['writes'] += write
+            counts['session_queries'] += session
+            counts['session_writes'] += write and session
+    return {metric: count / repeat for metric, count in counts.items()}
@@ -0,0 +1,256 @@
+"""
+Versioned caching of rendered poll fragments.
+
+Each question has a version number stored in the cache. Rendered
+fragments are cached under keys that include that version, so bumping
+the version is enough to invalidate everything rendered for the
+question without deleting any keys.
+
+shared_page() marks whole pages that are the same for every visitor as
+cacheable by browsers and shared caches (reverse proxies, or Django's
+per-view cache) for POLLS_PAGE_MAX_AGE seconds.
+"""
+import asyncio
+import functools
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import patch_cache_control
+
+from . import routers
+
+INDEX = 'index'
+
+
+def get_cache():
+    """Return the cache that holds poll fragments and their versions."""
+    return caches[settings.POLLS_CACHE_ALIAS]
+
+
+def _version_key(scope) -> str:
+    return f'polls:version:{scope}'
+
+
+def get_version(scope) -> int:
+    """
+    Return the current version for a question id or for INDEX.
+    A missing version starts from the current time in milliseconds, so a
+    version evicted from the cache never comes back with an old value.
+    """
+    cache = get_cache()
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns() // 1_000_000, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(scope) -> None:
+    """Invalidate every fragment cached for a question id or for INDEX."""
+    cache = get_cache()
+    key = _version_key(scope)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns() // 1_000_000, timeout=None)
+    cache.set(_modified_key(scope), time.time(), timeout=None)
+
+
+def _modified_key(scope) -> str:
+    return f'polls:modified:{scope}'
+
+
+def get_validators(scope):
+    """
+    Return the current version of `scope` and the time (in seconds since
+    the epoch) it was last bumped, read together in one cache round trip.
+    """
+    cache = get_cache()
+    version_key, modified_key = _version_key(scope), _modified_key(scope)
+    values = cache.get_many([version_key, modified_key])
+    version = values.get(version_key)
+    if version is None:
+        version = get_version(scope)
+    modified = values.get(modified_key)
+    if modified is None:
+        cache.add(modified_key, time.time(), timeout=None)
+        modified = cache.get(modified_key)
+    return version, modified
+
+
+def choices_scope(question_id) -> str:
+    """
+    Return the scope of what is cached about a question and its choices
+    but not their votes, which votes leave alone.
+    """
+    return f'choices:{question_id}'
+
+
+def invalidate(scope) -> None:
+    """
+    Bump the version of `scope` once the surrounding transaction commits
+    (at once outside of one). Until then readers only see the old data,
+    which stays correct under the old version.
+    """
+    transaction.on_commit(lambda: bump_version(scope))
+
+
+def _count(kind, outcome) -> None:
+    cache = get_cache()
+    key = f'polls:stats:{kind}:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+def _fragment_key(kind, scope, version, variant) -> str:
+    key = f'polls:{kind}:{scope}:{version}'
+    if variant:
+        key += f':{variant}'
+    if routers.reading_from_replica():
+        # A lagging replica renders old data under the current version;
+        # readers of the primary, such as a visitor who just voted, must
+        # not be served it
+        key += ':replica'
+    return key
+
+
+def get_or_render(kind, scope, render, timeout=None, variant='') -> str:
+    """
+    Return the fragment of `kind` cached for the current version of
+    `scope`, calling `render()` to build and store it on a miss.
+    `variant` tells apart fragments of one kind and scope, such as the
+    pages of the index.
+    """
+    cache = get_cache()
+    key = _fragment_key(kind, scope, get_version(scope), variant)
+    fragment = cache.get(key)
+    if fragment is not None:
+        _count(kind, 'hits')
+        return fragment
+    _count(kind, 'misses')
+    fragment = render()
+    if timeout is None:
+        timeout = settings.POLLS_CACHE_TIMEOUT
+    if routers.reading_from_replica():
+        # The replica may lag; do not keep its data past the next refresh
+        timeout = min(timeout, settings.REPLICA_CACHE_TIMEOUT)
+    cache.set(key, fragment, timeout)
+    return fragment
+
+
+async def aget_version(scope) -> int:
+    """Asynchronous version of get_version()."""
+    cache = get_cache()
+    key = _version_key(scope)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns() // 1_000_000, timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+async def aget_versions(scopes) -> dict:
+    """Return the current version of each scope in one cache round trip."""
+    cache = get_cache()
+    found = await cache.aget_many([_version_key(scope) for scope in scopes])
+    versions = {}
+    for scope in scopes:
+        version = found.get(_version_key(scope))
+        if version is None:
+            version = await aget_version(scope)
+        versions[scope] = version
+    return versions
+
+
+async def _acount(kind, outcome) -> None:
+    cache = get_cache()
+    key = f'polls:stats:{kind}:{outcome}'
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aadd(key, 1, timeout=None)
+
+
+async def aget_or_render(kind, scope, arender, timeout=None,
+                         variant='') -> str:
+    """
+    Asynchronous version of get_or_render(), where `arender()` is a
+    coroutine function that builds the fragment.
+    """
+    cache = get_cache()
+    key = _fragment_key(kind, scope, await aget_version(scope), variant)
+    fragment = await cache.aget(key)
+    if fragment is not None:
+        await _acount(kind, 'hits')
+        return fragment
+    await _acount(kind, 'misses')
+    fragment = await arender()
+    if timeout is None:
+        timeout = settings.POLLS_CACHE_TIMEOUT
+    if routers.reading_from_replica():
+        # The replica may lag; do not keep its data past the next refresh
+        timeout = min(timeout, settings.REPLICA_CACHE_TIMEOUT)
+    await cache.aset(key, fragment, timeout)
+    return fragment
+
+
+def stats(kinds=('index', 'results', 'api_index', 'api_detail',
+                'api_results', 'api_timeline')) -> dict:
+    """Return the hit and miss counters of each fragment kind."""
+    cache = get_cache()
+    counters = cache.get_many([
+        f'polls:stats:{kind}:{outcome}'
+        for kind in kinds for outcome in ('hits', 'misses')
+    ])
+    return {
+        kind: {
+            outcome: counters.get(f'polls:stats:{kind}:{outcome}', 0)
+            for outcome in ('hits', 'misses')
+        }
+        for kind in kinds
+    }
+
+
+def _mark_shared(request, response):
+    session = getattr(request, 'session', None)
+    if session is not None and session.accessed or response.cookies:
+        # Rendering depended on the user (e.g. a staff-only filter), so
+        # SessionMiddleware adds Vary: Cookie; keep it out of shared caches
+        patch_cache_control(response, private=True)
+    elif response.status_code == 200:
+        patch_cache_control(
+            response, public=True, max_age=settings.POLLS_PAGE_MAX_AGE
+        )
+    return response
+
+
+def shared_page(view):
+    """
+    Decorate a view (sync or async) whose pages are the same for every
+    visitor, so they may be cached for POLLS_PAGE_MAX_AGE seconds. The
+    per-user parts are loaded separately (see views.me). A page that
+    read the session or set a cookie after all is marked private.
+    """
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            response = await view(request, *args, **kwargs)
+            return _mark_shared(request, response)
+        return wrapped
+
+    @functools.wraps(view)
+    def wrapped(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if getattr(response, 'is_rendered', True):
+            return _mark_shared(request, response)
+        # Lazy TemplateResponses read the user while rendering
+        response.add_post_render_callback(
+            lambda rendered: _mark_shared(request, rendered)
+        )
+        return response
+    return wrapped
@@ -0,0 +1,63 @@
+"""
+CSV exports of vote tallies and raw votes for staff.
+
+Rows are read with values_list().iterator() and written out in blocks
+as they arrive, so exporting a question with a million votes holds one
+chunk of rows in memory rather than all of them.
+"""
+import csv
+from io import StringIO
+
+from django.http import StreamingHttpResponse
+
+from .models import Choice, Vote
+
+CHUNK_SIZE = 2000
+BLOCK_SIZE = 64 * 1024
+
+
+def tally_rows(question_ids=None, chunk_size=CHUNK_SIZE):
+    """Yield a header and the vote count of every choice."""
+    yield ('question_id', 'question', 'choice_id', 'choice', 'votes')
+    choices = Choice.objects.tallied().order_by('question_id', 'pk')
+    if question_ids is not None:
+        choices = choices.filter(question_id__in=question_ids)
+    yield from choices.values_list(
+        'question_id', 'question__question_text', 'id', 'choice_text',
+        'tally',
+    ).iterator(chunk_size=chunk_size)
+
+
+def vote_rows(question_ids=None, chunk_size=CHUNK_SIZE):
+    """Yield a header and one row per vote."""
+    yield (
+        'vote_id', 'question_id', 'user', 'choice_id', 'choice', 'created',
+        'updated',
+    )
+    votes = Vote.objects.order_by('question_id', 'pk')
+    if question_ids is not None:
+        votes = votes.filter(question_id__in=question_ids)
+    yield from votes.values_list(
+        'id', 'question_id', 'user__username', 'choice_id',
+        'choice__choice_text', 'created', 'updated',
+    ).iterator(chunk_size=chunk_size)
+
+
+def csv_blocks(rows, block_size=BLOCK_SIZE):
+    """Yield the CSV text of `rows` in blocks of about `block_size`."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= block_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def csv_response(rows, filename) -> StreamingHttpResponse:
+    """Return a streamed CSV download of `rows`."""
+    response = StreamingHttpResponse(csv_blocks(rows), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
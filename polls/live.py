@@ -0,0 +1,179 @@
+"""
+Live vote tallies pushed to browsers as Server-Sent Events.
+
+Each worker process runs one Broadcaster per event loop holding the
+open streams. Once per POLLS_LIVE_INTERVAL it reads the cache versions
+of all watched questions in one round trip. Every question whose
+version moved is tallied with a single query, and the tally goes to all
+of its subscribers. Votes bump these versions (see signals.py), so the
+cache doubles as the pub/sub channel: with a shared cache backend every
+worker sees the votes of the others. A burst of votes between two ticks
+becomes one update.
+"""
+import asyncio
+import json
+import logging
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import cache
+from .models import Choice
+from .tally import cached_question, tallied_choices
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """
+    One open stream. It keeps only the newest undelivered tally, so a
+    slow client skips updates instead of building up a backlog.
+    """
+
+    def __init__(self, question_id):
+        self.question_id = question_id
+        self.queue = asyncio.Queue(maxsize=1)
+
+    def offer(self, event) -> None:
+        """Queue `event`, replacing one the client has not read yet."""
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout):
+        """Wait up to `timeout` seconds for the next event."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+async def tally(question_id) -> dict:
+    """
+    Read the vote counters of a question's choices, from shared memory
+    when POLLS_SHARED_TALLY is on and the question is open.
+    """
+    choices = None
+    if settings.POLLS_SHARED_TALLY:
+        question = await sync_to_async(cached_question)(question_id)
+        if question is not None:
+            choices = await sync_to_async(tallied_choices)(question)
+    if choices is not None:
+        votes = {
+            str(choice.id): choice.tally
+            for choice in sorted(choices, key=lambda choice: choice.pk)
+        }
+    else:
+        votes = {
+            str(choice_id): count
+            async for choice_id, count in Choice.objects.filter(
+                question_id=question_id
+            ).tallied().order_by('pk').values_list('id', 'tally')
+        }
+    return {
+        'question': question_id,
+        'total_votes': sum(votes.values()),
+        'choices': votes,
+    }
+
+
+class Broadcaster:
+    """Fans out the tallies of watched questions to their subscribers."""
+
+    def __init__(self):
+        self.subscribers = {}
+        self.latest = {}
+        self.task = None
+
+    def __len__(self):
+        return sum(len(group) for group in self.subscribers.values())
+
+    @property
+    def full(self) -> bool:
+        return len(self) >= settings.POLLS_LIVE_MAX_CONNECTIONS
+
+    async def subscribe(self, question_id) -> Subscriber:
+        """
+        Add a subscriber to a question, queue the current tally for it
+        and start the tick loop if it is not running.
+        """
+        subscriber = Subscriber(question_id)
+        self.subscribers.setdefault(question_id, set()).add(subscriber)
+        version = await cache.aget_version(question_id)
+        latest = self.latest.get(question_id)
+        if latest is None or latest[0] != version:
+            latest = version, await tally(question_id)
+            self.latest[question_id] = latest
+        subscriber.offer(latest)
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+        return subscriber
+
+    def unsubscribe(self, subscriber) -> None:
+        """Remove a subscriber and stop ticking once nobody listens."""
+        group = self.subscribers.get(subscriber.question_id, set())
+        group.discard(subscriber)
+        if not group:
+            self.subscribers.pop(subscriber.question_id, None)
+            self.latest.pop(subscriber.question_id, None)
+        if not self.subscribers and self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.POLLS_LIVE_INTERVAL)
+            try:
+                await self.tick()
+            except Exception:
+                logger.exception("Live tally update failed")
+
+    async def tick(self) -> None:
+        """Send a fresh tally of every watched question that changed."""
+        question_ids = list(self.subscribers)
+        if not question_ids:
+            return
+        versions = await cache.aget_versions(question_ids)
+        for question_id in question_ids:
+            latest = self.latest.get(question_id)
+            if latest is not None and latest[0] == versions[question_id]:
+                continue
+            latest = versions[question_id], await tally(question_id)
+            self.latest[question_id] = latest
+            for subscriber in list(self.subscribers.get(question_id, ())):
+                subscriber.offer(latest)
+
+
+_broadcasters = weakref.WeakKeyDictionary()
+
+
+def get_broadcaster() -> Broadcaster:
+    """Return the Broadcaster of the running event loop."""
+    loop = asyncio.get_running_loop()
+    broadcaster = _broadcasters.get(loop)
+    if broadcaster is None:
+        broadcaster = _broadcasters[loop] = Broadcaster()
+    return broadcaster
+
+
+async def stream(broadcaster, question_id):
+    """
+    Yield the Server-Sent Events of one client: a tally whenever it
+    changes and a heartbeat comment on a quiet connection. The stream
+    ends after POLLS_LIVE_MAX_SECONDS and the browser reconnects, so
+    connections a server failed to notice closing do not pile up.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.POLLS_LIVE_MAX_SECONDS
+    subscriber = await broadcaster.subscribe(question_id)
+    try:
+        yield f'retry: {int(settings.POLLS_LIVE_INTERVAL * 1000)}\n\n'
+        while (remaining := deadline - loop.time()) > 0:
+            try:
+                version, data = await subscriber.get(
+                    min(settings.POLLS_LIVE_HEARTBEAT, remaining)
+                )
+            except asyncio.TimeoutError:
+                yield ': heartbeat\n\n'
+                continue
+            yield f'id: {version}\nevent: tally\ndata: {json.dumps(data)}\n\n'
+    finally:
+        broadcaster.unsubscribe(subscriber)
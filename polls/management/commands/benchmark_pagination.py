@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    setup_test_environment, teardown_test_environment,
+)
+
+from polls import benchmarks
+
+
+class Command(BaseCommand):
+    """
+    Seed a throwaway test database with a large archive of questions and
+    compare the cost of deep index pages fetched by keyset cursor and
+    by OFFSET.
+    """
+    help = "Benchmark keyset against offset pagination of the poll index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=1_000_000)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument(
+            '--depths', type=int, nargs='+', default=[0, 100, 10000],
+            help="Page numbers to fetch, counted from 0.",
+        )
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        depths = [
+            depth for depth in options['depths']
+            if (depth + 1) * options['page_size'] <= options['questions']
+        ]
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True
+        )
+        try:
+            benchmarks.seed_questions(options['questions'])
+            results = benchmarks.index_pagination(
+                depths=depths,
+                page_size=options['page_size'],
+                repeat=options['repeat'],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        for depth, methods in results.items():
+            self.stdout.write(f"page {depth:>7}  " + "  ".join(
+                f"{method} {metrics['median_ms']:8.2f} ms "
+                f"({metrics['queries']:g} queries)"
+                for method, metrics in methods.items()
+            ))
@@ -0,0 +1,84 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    setup_test_environment, teardown_test_environment,
+)
+
+from polls import benchmarks
+
+
+class Command(BaseCommand):
+    """
+    Seed a throwaway test database, benchmark every poll endpoint and
+    optionally fail when the numbers regress against a baseline file.
+    """
+    help = "Benchmark query counts and latency of the poll endpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=50)
+        parser.add_argument('--choices', type=int, default=4,
+                            help="Choices per question.")
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--votes', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20,
+                            help="Requests measured per endpoint.")
+        parser.add_argument('--output', help="Write the results as JSON.")
+        parser.add_argument('--baseline',
+                            help="JSON results to compare against.")
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help="Allowed relative growth of latency and allocations.",
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)['endpoints']
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True
+        )
+        try:
+            benchmarks.seed(
+                questions=options['questions'],
+                choices=options['choices'],
+                users=options['users'],
+                votes=options['votes'],
+            )
+            results = benchmarks.run(repeat=options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        for name, metrics in results.items():
+            self.stdout.write(
+                f"{name:15} {metrics['queries']:4g} queries "
+                f"{metrics['sql_ms']:8.2f} ms SQL  "
+                f"p50 {metrics['p50_ms']:8.2f}  p90 {metrics['p90_ms']:8.2f}  "
+                f"p99 {metrics['p99_ms']:8.2f} ms  "
+                f"{metrics['alloc_kb']:8.1f} KiB"
+            )
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump({
+                    'config': {
+                        key: options[key] for key in (
+                            'questions', 'choices', 'users', 'votes', 'repeat'
+                        )
+                    },
+                    'endpoints': results,
+                }, output_file, indent=2)
+
+        if baseline is not None:
+            regressions = benchmarks.compare(
+                results, baseline, options['tolerance']
+            )
+            if regressions:
+                raise CommandError(
+                    "Benchmark regressions:\n" + "\n".join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS("No regressions."))
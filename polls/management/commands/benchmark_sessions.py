@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import (
+    setup_test_environment, teardown_test_environment,
+)
+
+from polls import benchmarks
+
+SESSIONS = 'django.contrib.sessions.backends.'
+MESSAGES = 'django.contrib.messages.storage.'
+
+# (label, SESSION_ENGINE, MESSAGE_STORAGE); None keeps the setting
+PROFILES = [
+    ('django default', SESSIONS + 'db', MESSAGES + 'fallback.FallbackStorage'),
+    ('db + session', SESSIONS + 'db', MESSAGES + 'session.SessionStorage'),
+    ('db + cookie', SESSIONS + 'db', MESSAGES + 'cookie.CookieStorage'),
+    ('cached_db + cookie', SESSIONS + 'cached_db',
+     MESSAGES + 'cookie.CookieStorage'),
+    ('cache + cookie', SESSIONS + 'cache', MESSAGES + 'cookie.CookieStorage'),
+    ('configured', None, None),
+]
+
+
+class Command(BaseCommand):
+    """
+    Count the database queries and writes of one vote round trip (the
+    vote POST and the results page it redirects to) for several session
+    and message storage profiles. Runs on a throwaway test database.
+    """
+    help = "Benchmark the database writes of a vote per session profile."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True
+        )
+        try:
+            benchmarks.seed(questions=1, choices=4, users=10, votes=0)
+            results = {}
+            for label, engine, storage in PROFILES:
+                with override_settings(
+                    SESSION_ENGINE=engine or settings.SESSION_ENGINE,
+                    MESSAGE_STORAGE=storage or settings.MESSAGE_STORAGE,
+                ):
+                    results[label] = benchmarks.vote_round_trip(
+                        options['repeat']
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        for label, metrics in results.items():
+            self.stdout.write(
+                f"{label:<20} per vote {metrics['writes']:4.1f} writes, "
+                f"{metrics['queries']:4.1f} queries, "
+                f"of which {metrics['session_writes']:3.1f} writes and "
+                f"{metrics['session_queries']:3.1f} queries on sessions"
+            )
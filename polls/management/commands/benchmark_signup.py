@@ -0,0 +1,52 @@
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    setup_test_environment, teardown_test_environment,
+)
+
+from polls import benchmarks
+
+
+class Command(BaseCommand):
+    """
+    Measure how many users can sign up per second and per core with the
+    configured password hasher. Runs on a throwaway test database.
+    """
+    help = "Benchmark signups per second and per core."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads', type=int, default=None,
+            help="Concurrent signups (default: one per core).",
+        )
+        parser.add_argument('--seconds', type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                # Threads need a file database, not a shared in-memory one
+                connection.settings_dict['TEST']['NAME'] = str(
+                    Path(directory) / 'benchmark.sqlite3'
+                )
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True
+            )
+            try:
+                result = benchmarks.signup_throughput(
+                    threads=options['threads'], seconds=options['seconds']
+                )
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+        self.stdout.write(
+            f"{settings.PASSWORD_HASHER}: "
+            f"{result['signups_per_s']:.1f} signups/s, "
+            f"{result['signups_per_s_per_core']:.1f} signups/s per core "
+            f"({result['hash_ms']:.0f} ms per password hash, "
+            f"{result['errors_per_s']:.1f} errors/s)"
+        )
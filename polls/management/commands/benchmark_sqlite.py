@@ -0,0 +1,57 @@
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from polls import benchmarks
+
+
+class Command(BaseCommand):
+    """
+    Compare concurrent read/write throughput of a plain SQLite database
+    with the production profile (WAL, tuned PRAGMAs, BEGIN IMMEDIATE),
+    each in a temporary file.
+    """
+    help = "Benchmark concurrent SQLite throughput with and without tuning."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            profiles = {
+                'default': {
+                    'ENGINE': 'django.db.backends.sqlite3',
+                    # the sqlite3 module's default busy timeout
+                    'OPTIONS': {'timeout': 5},
+                },
+                'production': {**settings.SQLITE_PRODUCTION, 'CONN_MAX_AGE': 0},
+            }
+            for name, profile in profiles.items():
+                alias = f'benchmark_{name}'
+                connections.settings[alias] = connections.configure_settings({
+                    'default': {
+                        **profile,
+                        'NAME': str(Path(directory) / f'{name}.sqlite3'),
+                    },
+                })['default']
+                try:
+                    result = benchmarks.database_concurrency(
+                        alias,
+                        writers=options['writers'],
+                        readers=options['readers'],
+                        seconds=options['seconds'],
+                    )
+                finally:
+                    connections[alias].close()
+                    del connections.settings[alias]
+                self.stdout.write(
+                    f"{name:10} writes/s {result.get('writes', 0):9.1f} "
+                    f"(errors {result.get('writes_errors', 0):.1f}/s)  "
+                    f"reads/s {result.get('reads', 0):9.1f} "
+                    f"(errors {result.get('reads_errors', 0):.1f}/s)"
+                )
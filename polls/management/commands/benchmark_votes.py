@@ -0,0 +1,61 @@
+import tempfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    setup_test_environment, teardown_test_environment,
+)
+
+from polls import benchmarks
+
+
+class Command(BaseCommand):
+    """
+    Measure concurrent vote throughput on the configured database, so a
+    SQLite and a PostgreSQL (DATABASE_URL) deployment can be compared,
+    or the same poll with different numbers of counter shards (--shards
+    1 4 16). Runs on a throwaway test database.
+    """
+    help = "Benchmark concurrent votes per second on the configured database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument(
+            '--shards', type=int, nargs='+', default=[1],
+            help="Counter shards of the poll; one run per value.",
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                # Threads need a file database, not a shared in-memory one
+                connection.settings_dict['TEST']['NAME'] = str(
+                    Path(directory) / 'benchmark.sqlite3'
+                )
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True
+            )
+            try:
+                benchmarks.seed(
+                    questions=1, choices=4, users=options['users'], votes=0
+                )
+                results = {
+                    shards: benchmarks.vote_throughput(
+                        threads=options['threads'],
+                        seconds=options['seconds'], shards=shards,
+                    )
+                    for shards in options['shards']
+                }
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+        for shards, result in results.items():
+            self.stdout.write(
+                f"{connection.vendor}: {result.get('votes', 0):.1f} votes/s "
+                f"({result.get('errors', 0):.1f} errors/s) "
+                f"with {options['threads']} threads and {shards} shard(s)"
+            )
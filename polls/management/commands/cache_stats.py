@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from polls import cache
+
+
+class Command(BaseCommand):
+    """
+    Print the hit and miss counters of the cached poll fragments.
+    The counters live in the cache itself, so they cover every worker
+    only when the cache backend is shared (e.g. FileBasedCache).
+    """
+    help = "Report hit and miss counters of the poll fragment cache."
+
+    def handle(self, *args, **options):
+        for kind, counters in cache.stats().items():
+            lookups = counters['hits'] + counters['misses']
+            ratio = counters['hits'] / lookups if lookups else 0
+            self.stdout.write(
+                f"{kind}: {counters['hits']} hits, "
+                f"{counters['misses']} misses ({ratio:.0%} hit rate)"
+            )
@@ -0,0 +1,42 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from polls import cache
+from polls.models import HOUR, MINUTE, VoteRollup, bucket_start
+
+
+class Command(BaseCommand):
+    """
+    Fold per-minute vote rollups older than --older-than hours into
+    hourly ones, so a timeline of a long poll reads one row per choice
+    and hour. Meant to be run periodically, e.g. hourly from cron.
+    """
+    help = "Compact per-minute vote rollups into hourly rollups."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            default=settings.POLLS_ROLLUP_MINUTE_HOURS,
+            help="Keep the minute rollups of the last N hours "
+                 "(default POLLS_ROLLUP_MINUTE_HOURS).",
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - datetime.timedelta(
+            hours=options['older_than']
+        )
+        question_ids = set(VoteRollup.objects.filter(
+            resolution=MINUTE, bucket__lt=bucket_start(before, HOUR)
+        ).values_list('question_id', flat=True).distinct())
+        folded = VoteRollup.objects.compact(before)
+        # Minute timelines of these questions now show hours instead
+        for question_id in question_ids:
+            cache.invalidate(question_id)
+        self.stdout.write(self.style.SUCCESS(
+            f"Folded {folded} minute rollup(s) of {len(question_ids)} "
+            f"question(s) into hourly rollups."
+        ))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from polls.models import ChoiceVoteShard
+
+
+class Command(BaseCommand):
+    """
+    Fold the counter shards of sharded questions back into Choice.votes
+    and Question.total_votes, so results sum fewer non-zero rows and the
+    stored counters catch up. Meant to be run periodically, e.g. every
+    minute from cron while a busy poll is open.
+    """
+    help = "Fold vote counter shards into the choice and question counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--question', type=int, action='append', dest='questions',
+            help="Only fold the shards of this question (repeatable).",
+        )
+
+    def handle(self, *args, **options):
+        # Results read the sum, which folding leaves unchanged, so no
+        # cached fragment has to be invalidated
+        question_ids = ChoiceVoteShard.objects.compact(options['questions'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Folded the counter shards of {len(question_ids)} question(s)."
+        ))
@@ -0,0 +1,40 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls import transfer
+
+
+class Command(BaseCommand):
+    """
+    Write every question, choice and vote as JSON Lines or CSV, reading
+    the tables in chunks so memory use does not grow with their size.
+    """
+    help = "Stream polls and votes to a JSON Lines or CSV file."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output', nargs='?', default='-',
+            help="File to write, or - for standard output.",
+        )
+        parser.add_argument('--format', choices=('jsonl', 'csv'))
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        output = options['output']
+        fmt = options['format'] or (
+            'csv' if output.endswith('.csv') else 'jsonl'
+        )
+        records = transfer.export_records(options['chunk_size'])
+        started = time.perf_counter()
+        if output == '-':
+            count = transfer.write_records(records, sys.stdout, fmt)
+        else:
+            with open(output, 'w', newline='') as output_file:
+                count = transfer.write_records(records, output_file, fmt)
+        elapsed = time.perf_counter() - started
+        self.stderr.write(
+            f"Exported {count} rows in {elapsed:.1f} s "
+            f"({count / elapsed if elapsed else 0:.0f} rows/s)."
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from polls.vote_queue import get_queue
+
+
+class Command(BaseCommand):
+    """
+    Drain every vote waiting in the write-behind queue into the
+    database. Run it when stopping the application servers.
+    """
+    help = "Move all queued votes into the database."
+
+    def handle(self, *args, **options):
+        moved = get_queue().flush()
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} queued vote(s) into the database."
+        ))
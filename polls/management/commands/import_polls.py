@@ -0,0 +1,64 @@
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from polls import transfer
+
+
+class Command(BaseCommand):
+    """
+    Import a file written by export_polls in chunked transactions.
+    Questions and choices get new ids; votes are recorded through
+    Vote.objects.restore_many(), which keeps the vote counters in step
+    and the times the votes were cast.
+    An interrupted import continues from its checkpoint when run again.
+    """
+    help = "Import polls and votes from a JSON Lines or CSV file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="File written by export_polls.")
+        parser.add_argument('--format', choices=('jsonl', 'csv'))
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help="Rows inserted per transaction.")
+        parser.add_argument(
+            '--checkpoint',
+            help="Progress file used to resume (default: INPUT.checkpoint).",
+        )
+        parser.add_argument(
+            '--create-users', action='store_true',
+            help="Create voters missing from this site, without a password.",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        path = options['input']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        importer = transfer.Importer(
+            chunk_size=options['chunk_size'],
+            checkpoint=options['checkpoint'] or f'{path}.checkpoint',
+            create_users=options['create_users'],
+            progress=self.report_progress,
+        )
+        if importer.done:
+            self.stdout.write(f"Resuming after {importer.done} rows.")
+        started = time.perf_counter()
+        with open(path, newline='') as input_file:
+            try:
+                counts = importer.run(transfer.read_records(input_file, fmt))
+            except (ValidationError, KeyError, ValueError) as error:
+                raise CommandError(
+                    f"Import stopped after {importer.done} rows: {error}\n"
+                    f"Fix the input and run the command again to resume."
+                )
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {counts['question']} questions, {counts['choice']} "
+            f"choices and {counts['vote']} votes in {elapsed:.1f} s "
+            f"({total / elapsed if elapsed else 0:.0f} rows/s)."
+        ))
+
+    def report_progress(self, done, rate):
+        if self.verbosity >= 2:
+            self.stdout.write(f"{done} rows ({rate:.0f} rows/s)")
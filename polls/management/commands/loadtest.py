@@ -0,0 +1,156 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(values, fraction):
+    """Return the value at `fraction` (0..1) of the sorted `values`."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class HttpClient:
+    """Minimal HTTP/1.1 keep-alive client for GET requests."""
+
+    def __init__(self, host, port, path, timeout):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port
+        )
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def get(self) -> int:
+        """Send one GET request, read the whole response, return status."""
+        if self.writer is None:
+            await self._connect()
+        self.writer.write(
+            f"GET {self.path} HTTP/1.1\r\nHost: {self.host}\r\n"
+            f"Connection: keep-alive\r\n\r\n".encode()
+        )
+        await self.writer.drain()
+        head = await asyncio.wait_for(
+            self.reader.readuntil(b"\r\n\r\n"), self.timeout
+        )
+        lines = head.decode('latin-1').split("\r\n")
+        status = int(lines[0].split()[1])
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        if 'content-length' in headers:
+            await asyncio.wait_for(
+                self.reader.readexactly(int(headers['content-length'])),
+                self.timeout,
+            )
+        else:
+            await asyncio.wait_for(self.reader.read(), self.timeout)
+        if (headers.get('connection', '').lower() == 'close'
+                or 'content-length' not in headers):
+            await self.close()
+        return status
+
+
+class Command(BaseCommand):
+    """
+    Drive a running server with many concurrent keep-alive connections
+    and report throughput and latency percentiles, e.g. to compare the
+    WSGI (gunicorn) and ASGI (uvicorn with POLLS_ASYNC_VIEWS) setups.
+    """
+    help = "Load test a URL of a running server."
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help="e.g. http://127.0.0.1:8000/polls/")
+        parser.add_argument(
+            '--concurrency', type=int, default=100,
+            help="Number of concurrent connections.",
+        )
+        parser.add_argument(
+            '--duration', type=float, default=10.0,
+            help="Seconds to keep sending requests.",
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=30.0,
+            help="Seconds to wait for each response.",
+        )
+        parser.add_argument(
+            '--json', action='store_true',
+            help="Print the report as JSON.",
+        )
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError("Only plain http:// URLs are supported.")
+        path = url.path or '/'
+        if url.query:
+            path += '?' + url.query
+        report = asyncio.run(self.run(
+            url.hostname, url.port or 80, path,
+            options['concurrency'], options['duration'], options['timeout'],
+        ))
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(
+            f"{report['requests']} requests, {report['errors']} errors "
+            f"in {report['seconds']:.1f}s "
+            f"({report['requests_per_second']:.1f} req/s) with "
+            f"{report['concurrency']} connections\n"
+            f"latency ms: p50 {report['p50_ms']:.1f}  "
+            f"p90 {report['p90_ms']:.1f}  p99 {report['p99_ms']:.1f}  "
+            f"max {report['max_ms']:.1f}"
+        )
+
+    async def run(self, host, port, path, concurrency, duration, timeout):
+        latencies = []
+        errors = 0
+        deadline = time.perf_counter() + duration
+
+        async def connection():
+            nonlocal errors
+            client = HttpClient(host, port, path, timeout)
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    status = await client.get()
+                except (OSError, asyncio.IncompleteReadError,
+                        asyncio.TimeoutError, ValueError):
+                    errors += 1
+                    await client.close()
+                    continue
+                if status >= 400:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - started)
+            await client.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(connection() for _ in range(concurrency)))
+        seconds = time.perf_counter() - started
+        return {
+            'concurrency': concurrency,
+            'requests': len(latencies),
+            'errors': errors,
+            'seconds': seconds,
+            'requests_per_second': len(latencies) / seconds,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p90_ms': percentile(latencies, 0.90) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'max_ms': max(latencies, default=0) * 1000,
+        }
@@ -0,0 +1,49 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    """
+    Delete expired sessions in small batches, each in its own short
+    transaction, so that votes and logins are not locked out while a
+    large backlog is cleared (clearsessions deletes them all at once).
+    Sessions of the cache and cookie engines expire on their own.
+    """
+    help = "Delete expired sessions in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--sleep', type=float, default=0.0,
+            help="Seconds to pause between batches.",
+        )
+
+    def handle(self, *args, **options):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        if not hasattr(store, 'get_model_class'):
+            store.clear_expired()
+            self.stdout.write(
+                f"{settings.SESSION_ENGINE} keeps no session table."
+            )
+            return
+        sessions = store.get_model_class().objects
+        now = timezone.now()
+        deleted = batches = 0
+        while True:
+            keys = list(sessions.filter(
+                expire_date__lt=now
+            ).values_list('pk', flat=True)[:options['batch_size']])
+            if not keys:
+                break
+            count, _ = sessions.filter(pk__in=keys).delete()
+            deleted += count
+            batches += 1
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} expired session(s) in {batches} batch(es)."
+        ))
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from polls import cache
+from polls.models import Choice, ChoiceVoteShard, Question, Vote
+
+
+class Command(BaseCommand):
+    """
+    Recount the stored vote counters on Choice and Question from the
+    Vote rows and report any drift that was found.
+    """
+    help = "Rebuild Choice.votes and Question.total_votes from Vote rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only report drift, do not write the corrected counters.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # Counters are only comparable once the shards are folded in
+            ChoiceVoteShard.objects.compact()
+            choice_counts = dict(
+                Vote.objects.values_list('choice')
+                .annotate(n=Count('id')).order_by()
+            )
+            question_counts = {}
+            drifted_choices = []
+            for choice in Choice.objects.select_for_update().only(
+                'id', 'question_id', 'votes'
+            ):
+                actual = choice_counts.get(choice.id, 0)
+                question_counts[choice.question_id] = (
+                    question_counts.get(choice.question_id, 0) + actual
+                )
+                if choice.votes != actual:
+                    self.stdout.write(
+                        f"Choice {choice.id}: stored {choice.votes}, "
+                        f"counted {actual}"
+                    )
+                    choice.votes = actual
+                    drifted_choices.append(choice)
+
+            drifted_questions = []
+            for question in Question.objects.select_for_update().only(
+                'id', 'total_votes'
+            ):
+                actual = question_counts.get(question.id, 0)
+                if question.total_votes != actual:
+                    self.stdout.write(
+                        f"Question {question.id}: stored "
+                        f"{question.total_votes}, counted {actual}"
+                    )
+                    question.total_votes = actual
+                    drifted_questions.append(question)
+
+            if options['dry_run']:
+                # Undo the folding of the shards as well
+                transaction.set_rollback(True)
+            else:
+                Choice.objects.bulk_update(drifted_choices, ['votes'])
+                Question.objects.bulk_update(
+                    drifted_questions, ['total_votes']
+                )
+                for question_id in {
+                    choice.question_id for choice in drifted_choices
+                } | {question.id for question in drifted_questions}:
+                    cache.invalidate(question_id)
+
+        verb = "Found" if options['dry_run'] else "Fixed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} drift in {len(drifted_choices)} choice(s) and "
+            f"{len(drifted_questions)} question(s)."
+        ))
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.tally import SharedTally
+
+
+class Command(BaseCommand):
+    """
+    Reload the shared-memory vote tally from the database now, e.g.
+    after votes were changed outside the application, or remove it with
+    --unlink once every worker has stopped.
+    """
+    help = "Reload the shared vote tally from the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--unlink', action='store_true',
+            help="Remove the shared memory block instead.",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.POLLS_SHARED_TALLY:
+            raise CommandError("POLLS_SHARED_TALLY is off.")
+        tally = SharedTally(
+            settings.POLLS_SHARED_TALLY_NAME, settings.POLLS_SHARED_TALLY_SLOTS
+        )
+        if options['unlink']:
+            tally.close()
+            tally.unlink()
+            self.stdout.write(self.style.SUCCESS(
+                f"Removed the shared tally {tally.name!r}."
+            ))
+            return
+        tracked = tally.reconcile()
+        tally.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded the votes of {tracked} choice(s) into {tally.name!r}."
+        ))
@@ -0,0 +1,50 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from polls import routers
+
+
+class Command(BaseCommand):
+    """
+    Copy the SQLite primary over the SQLite replicas in DATABASE_REPLICAS,
+    a local stand-in for streaming replication. Run it from cron, or keep
+    it running with --every. Replicas on other databases (e.g. a Postgres
+    streaming replica) are kept up to date by the server and skipped.
+    """
+    help = "Refresh SQLite snapshot replicas from the primary database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every', type=float, default=0,
+            help="Refresh again every N seconds until interrupted.",
+        )
+
+    def handle(self, *args, **options):
+        primary = connections['default']
+        snapshots = [
+            alias for alias in settings.DATABASE_REPLICAS
+            if connections[alias].vendor == 'sqlite'
+        ]
+        if snapshots and primary.vendor != 'sqlite':
+            raise CommandError(
+                "Snapshot replicas need a SQLite primary database."
+            )
+        for alias in settings.DATABASE_REPLICAS:
+            if alias not in snapshots:
+                self.stdout.write(f"{alias} is replicated by its server.")
+        while True:
+            for alias in snapshots:
+                started = time.perf_counter()
+                routers.refresh_snapshot(
+                    primary, connections[alias].settings_dict['NAME']
+                )
+                self.stdout.write(self.style.SUCCESS(
+                    f"Refreshed {alias} in "
+                    f"{(time.perf_counter() - started) * 1000:.0f} ms."
+                ))
+            if not options['every']:
+                break
+            time.sleep(options['every'])
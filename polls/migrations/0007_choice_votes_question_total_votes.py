@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:32
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_votes(apps, schema_editor):
+    """Fill the new vote counters from the existing Vote rows."""
+    Choice = apps.get_model('polls', 'Choice')
+    Question = apps.get_model('polls', 'Question')
+    Vote = apps.get_model('polls', 'Vote')
+    choice_votes = Vote.objects.filter(
+        choice=OuterRef('pk')
+    ).values('choice').annotate(n=Count('id')).values('n')
+    Choice.objects.update(votes=Coalesce(Subquery(choice_votes), 0))
+    question_votes = Vote.objects.filter(
+        choice__question=OuterRef('pk')
+    ).values('choice__question').annotate(n=Count('id')).values('n')
+    Question.objects.update(total_votes=Coalesce(Subquery(question_votes), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0006_alter_question_pub_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='choice',
+            name='votes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='total_votes',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='total votes'),
+        ),
+        migrations.RunPython(count_votes, migrations.RunPython.noop),
+    ]
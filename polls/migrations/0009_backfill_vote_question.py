@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:51
+
+from django.db import migrations
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_vote_question(apps, schema_editor):
+    """
+    Copy each vote's question from its choice, drop all but the latest
+    duplicate vote per (user, question) and recount the vote counters.
+    """
+    Choice = apps.get_model('polls', 'Choice')
+    Question = apps.get_model('polls', 'Question')
+    Vote = apps.get_model('polls', 'Vote')
+    Vote.objects.update(question=Subquery(
+        Choice.objects.filter(pk=OuterRef('choice')).values('question')[:1]
+    ))
+
+    duplicates = Vote.objects.values('user', 'question').annotate(
+        n=Count('id'), latest=Max('id')
+    ).filter(n__gt=1)
+    for duplicate in duplicates.iterator():
+        Vote.objects.filter(
+            user=duplicate['user'],
+            question=duplicate['question'],
+        ).exclude(pk=duplicate['latest']).delete()
+
+    choice_votes = Vote.objects.filter(
+        choice=OuterRef('pk')
+    ).values('choice').annotate(n=Count('id')).values('n')
+    Choice.objects.update(votes=Coalesce(Subquery(choice_votes), 0))
+    question_votes = Vote.objects.filter(
+        question=OuterRef('pk')
+    ).values('question').annotate(n=Count('id')).values('n')
+    Question.objects.update(total_votes=Coalesce(Subquery(question_votes), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_vote_question'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_vote_question, migrations.RunPython.noop),
+    ]
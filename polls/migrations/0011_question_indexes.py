@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0010_alter_vote_question_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-pub_date'], name='question_pub_date_desc'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['end_date', 'pub_date'], name='question_end_pub_date'),
+        ),
+    ]
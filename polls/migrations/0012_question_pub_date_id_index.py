@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0011_question_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='question',
+            name='question_pub_date_desc',
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-pub_date', '-id'], name='question_pub_date_id_desc'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:13
+
+import datetime
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def rollup_existing_votes(apps, schema_editor):
+    """
+    Put the votes cast before rollups existed into the current hour's
+    rollup, since they carry no time of their own.
+    """
+    Vote = apps.get_model('polls', 'Vote')
+    VoteRollup = apps.get_model('polls', 'VoteRollup')
+    now = int(django.utils.timezone.now().timestamp())
+    bucket = datetime.datetime.fromtimestamp(
+        now // 3600 * 3600, tz=datetime.timezone.utc
+    )
+    VoteRollup.objects.bulk_create([
+        VoteRollup(
+            question_id=question_id, choice_id=choice_id,
+            resolution=3600, bucket=bucket, votes=votes,
+        )
+        for question_id, choice_id, votes in Vote.objects.values_list(
+            'question_id', 'choice_id'
+        ).annotate(n=Count('id')).order_by().values_list(
+            'question_id', 'choice_id', 'n'
+        )
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0012_question_pub_date_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='updated',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.CreateModel(
+            name='VoteRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveIntegerField(choices=[(60, 'minute'), (3600, 'hour')])),
+                ('bucket', models.DateTimeField()),
+                ('votes', models.IntegerField(default=0)),
+                ('choice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.choice')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.question')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['question', 'bucket'], name='rollup_question_bucket')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='voterollup',
+            constraint=models.UniqueConstraint(fields=('choice', 'resolution', 'bucket'), name='unique_rollup_per_choice_bucket'),
+        ),
+        migrations.RunPython(rollup_existing_votes, migrations.RunPython.noop),
+    ]
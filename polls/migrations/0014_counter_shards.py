@@ -0,0 +1,55 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:46
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0013_vote_timestamps_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChoiceVoteShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('votes', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveConstraint(
+            model_name='voterollup',
+            name='unique_rollup_per_choice_bucket',
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='counter_shards',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Spread the vote counters of a busy poll over this many rows, so that concurrent votes do not wait for each other. Results then sum the rows.', validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(64)], verbose_name='counter shards'),
+        ),
+        migrations.AddField(
+            model_name='voterollup',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='voterollup',
+            constraint=models.UniqueConstraint(fields=('choice', 'resolution', 'bucket', 'shard'), name='unique_rollup_per_choice_bucket_shard'),
+        ),
+        migrations.AddField(
+            model_name='choicevoteshard',
+            name='choice',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.choice'),
+        ),
+        migrations.AddField(
+            model_name='choicevoteshard',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.question'),
+        ),
+        migrations.AddConstraint(
+            model_name='choicevoteshard',
+            constraint=models.UniqueConstraint(fields=('choice', 'shard'), name='unique_shard_per_choice'),
+        ),
+    ]
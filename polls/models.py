@@ -1,21 +1,103 @@
 import datetime
+import random
+from collections import Counter
 
-from django.db import models
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import connections, models, router, transaction
+from django.db.models import (
+    Case, ExpressionWrapper, F, IntegerField, OuterRef, Q, Subquery, Sum,
+    Value, When,
+)
+from django.db.models.functions import Coalesce, Trunc
+from django.dispatch import Signal
 from django.utils import timezone
 from django.contrib import admin
 
 # from django.contrib.auth.models import User
 
 
+def _shard_votes(field):
+    """
+    Sum the counter shards whose `field` ('question' or 'choice') is the
+    outer row, for annotating querysets of that model.
+    """
+    return Coalesce(Subquery(
+        ChoiceVoteShard.objects.filter(**{field: OuterRef('pk')})
+        .order_by().values(field).annotate(total=Sum('votes'))
+        .values('total')
+    ), 0)
+
+
+class QuestionQuerySet(models.QuerySet):
+    """
+    Filters matching the publication and voting rules of Question,
+    evaluated by the database instead of row by row.
+    """
+
+    def published(self):
+        """Questions whose pub_date has passed."""
+        return self.filter(pub_date__lte=timezone.now())
+
+    def open(self):
+        """Published questions that can still be voted on (see can_vote)."""
+        now = timezone.now()
+        return self.filter(
+            Q(end_date__isnull=True) | Q(end_date__gte=now),
+            pub_date__lte=now,
+        )
+
+    def closed(self):
+        """Published questions whose end_date has passed."""
+        now = timezone.now()
+        return self.filter(pub_date__lte=now, end_date__lt=now)
+
+    def upcoming(self):
+        """Questions that are not published yet."""
+        return self.filter(pub_date__gt=timezone.now())
+
+    def tallied(self):
+        """
+        Annotate `tally`, the total votes including those still held in
+        counter shards.
+        """
+        return self.annotate(tally=ExpressionWrapper(
+            F('total_votes') + _shard_votes('question'),
+            output_field=IntegerField(),
+        ))
+
+
 class Question(models.Model):
     """
     Represents a poll question and contains the question text,
     publish date, and end date for voting.
     """
-    objects = None
+    objects = QuestionQuerySet.as_manager()
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField("date published", default=timezone.now)
     end_date = models.DateTimeField("end date", null=True, blank=True)
+    total_votes = models.PositiveIntegerField(
+        "total votes", default=0, editable=False
+    )
+    counter_shards = models.PositiveSmallIntegerField(
+        "counter shards", default=1,
+        validators=[MinValueValidator(1), MaxValueValidator(64)],
+        help_text="Spread the vote counters of a busy poll over this many "
+                  "rows, so that concurrent votes do not wait for each "
+                  "other. Results then sum the rows.",
+    )
+
+    class Meta:
+        indexes = [
+            # Latest published questions, newest first, in the
+            # (pub_date, id) order used by the index pages
+            models.Index(
+                fields=['-pub_date', '-id'], name='question_pub_date_id_desc'
+            ),
+            # Open or closed polls by end date
+            models.Index(
+                fields=['end_date', 'pub_date'], name='question_end_pub_date'
+            ),
+        ]
 
     @admin.display(
         boolean=True,
@@ -32,6 +114,24 @@ class Question(models.Model):
     def __str__(self) -> str:
         return self.question_text
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The shards as loaded or last saved, to tell when save() unshards
+        self._saved_shards = self.__dict__.get('counter_shards')
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._saved_shards = self.__dict__.get('counter_shards')
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        shards = self.__dict__.get('counter_shards')
+        if shards == 1 and self._saved_shards != 1:
+            # Fold the shards of a poll that is no longer sharded, so its
+            # counters can count down the votes that were held in them
+            ChoiceVoteShard.objects.compact([self.pk])
+        self._saved_shards = shards
+
     def is_published(self) -> bool:
         """
         Returns True if the question is published.
@@ -51,23 +151,529 @@ class Question(models.Model):
         return self.pub_date <= now <= self.end_date
 
 
+class ChoiceQuerySet(models.QuerySet):
+    def tallied(self):
+        """
+        Annotate `tally`, the votes of each choice including those still
+        held in counter shards.
+        """
+        return self.annotate(tally=ExpressionWrapper(
+            F('votes') + _shard_votes('choice'), output_field=IntegerField()
+        ))
+
+
 class Choice(models.Model):
     """ Represents a choice for a poll question. """
+    objects = ChoiceQuerySet.as_manager()
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
-
-    @property
-    def votes(self) -> int:
-        return self.vote_set.count()
+    votes = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self) -> str:
         return self.choice_text
 
 
+# Sent once per question after votes on it have been recorded, with the
+# `question_id` and `changes`, a list of (previous_choice_id, choice_id)
+# pairs where previous_choice_id is None for a first vote.
+vote_cast = Signal()
+
+
+def _add_to_counters(queryset, field, deltas, key='pk'):
+    """
+    Add each delta in `deltas` (a mapping of `key` values to deltas) to
+    the `field` counter of the matching rows of `queryset`, in a single
+    UPDATE statement.
+    """
+    deltas = {value: delta for value, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    queryset.filter(**{f'{key}__in': deltas}).update(**{
+        field: F(field) + Case(
+            *[
+                When(**{key: value}, then=Value(delta))
+                for value, delta in deltas.items()
+            ],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    })
+
+
+def apply_vote_changes(changes, shards_of=None, rollups=True):
+    """
+    Update the vote counters and the current minute's rollups for
+    recorded votes and announce them.
+    `changes` is a list of (question_id, previous_choice_id, choice_id)
+    tuples, where previous_choice_id is None for a first vote and
+    choice_id is None for a vote that was deleted.
+    `shards_of` maps question ids to their counter_shards, and is read
+    from the database when not given. The votes of a question with
+    several shards go to one of them, picked at random, instead of the
+    Choice and Question rows that every vote would otherwise update.
+    With `rollups` false the rollups are left to the caller.
+    """
+    if shards_of is None:
+        shards_of = dict(Question.objects.filter(
+            pk__in={question_id for question_id, _, _ in changes}
+        ).values_list('pk', 'counter_shards')) if changes else {}
+    shard_of = {
+        question_id: random.randrange(shards)
+        for question_id, shards in shards_of.items() if shards > 1
+    }
+    choice_deltas = Counter()
+    question_deltas = Counter()
+    question_of = {}
+    for question_id, previous_choice_id, choice_id in changes:
+        if choice_id is not None:
+            choice_deltas[choice_id] += 1
+            question_of[choice_id] = question_id
+        if previous_choice_id is not None:
+            choice_deltas[previous_choice_id] -= 1
+            question_of[previous_choice_id] = question_id
+        question_deltas[question_id] += (
+            (previous_choice_id is None) - (choice_id is None)
+        )
+    _add_to_counters(Choice.objects, 'votes', {
+        choice_id: delta for choice_id, delta in choice_deltas.items()
+        if question_of[choice_id] not in shard_of
+    })
+    _add_to_counters(Question.objects, 'total_votes', {
+        question_id: delta for question_id, delta in question_deltas.items()
+        if question_id not in shard_of
+    })
+    ChoiceVoteShard.objects.add({
+        choice_id: delta for choice_id, delta in choice_deltas.items()
+        if question_of[choice_id] in shard_of
+    }, question_of, shard_of)
+    if rollups:
+        VoteRollup.objects.record(
+            choice_deltas, question_of, shard_of=shard_of
+        )
+    changes_by_question = {}
+    for question_id, previous_choice_id, choice_id in changes:
+        changes_by_question.setdefault(question_id, []).append(
+            (previous_choice_id, choice_id)
+        )
+    for question_id, question_changes in changes_by_question.items():
+        vote_cast.send(
+            sender=Vote, question_id=question_id, changes=question_changes
+        )
+
+
+def remove_choice_votes(choice_id):
+    """
+    Take the stored votes of the choice `choice_id`, which is about to
+    be deleted, off its question's total. Its votes, counter shards and
+    rollups are deleted with it.
+    """
+    Question.objects.filter(choice=choice_id).update(
+        total_votes=F('total_votes') - Subquery(
+            Choice.objects.filter(pk=choice_id).values('votes')
+        )
+    )
+
+
+class VoteManager(models.Manager):
+    """
+    Manager for votes that keeps the denormalized vote counters on
+    Choice and Question in step with the Vote rows.
+    """
+
+    def cast(self, user, choice):
+        """
+        Record a vote by `user` for `choice`, replacing any earlier vote
+        the user made on the same question.
+        Returns the id of the previously selected choice, or None.
+
+        The (user, question) row is inserted or changed by a single
+        upsert statement that also returns the choice it replaced, so
+        concurrent submissions by the same user cannot create duplicate
+        votes or count the same vote twice.
+        """
+        using = router.db_for_write(self.model)
+        connection = connections[using]
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        with transaction.atomic(using=using):
+            with connection.cursor() as cursor:
+                cursor.execute(self._upsert_sql(connection), [
+                    user.pk, choice.question_id,
+                    user.pk, choice.question_id, choice.pk, now, now,
+                ])
+                row = cursor.fetchone()
+            if row is None:
+                # Already the user's choice, or replaced by a concurrent
+                # vote of the same user that the counters already have
+                return choice.pk
+            previous_choice_id = row[0]
+            apply_vote_changes(
+                [(choice.question_id, previous_choice_id, choice.pk)],
+                {choice.question_id: choice.question.counter_shards},
+            )
+        return previous_choice_id
+
+    def _upsert_sql(self, connection):
+        # `old` is materialized by the SELECT it is counted in, before the
+        # row is written, and read-locked where the database can lock
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        lock = ' FOR UPDATE' if connection.features.has_select_for_update else ''
+        return f"""
+            WITH old AS MATERIALIZED (
+                SELECT choice_id FROM {table}
+                WHERE user_id = %s AND question_id = %s{lock}
+            )
+            INSERT INTO {table}
+                (user_id, question_id, choice_id, created, updated)
+            SELECT %s, %s, %s, %s, %s
+            FROM (SELECT COUNT(*) FROM old) AS evaluated WHERE true
+            ON CONFLICT (user_id, question_id) DO UPDATE
+            SET choice_id = excluded.choice_id, updated = excluded.updated
+            WHERE {table}.choice_id = (SELECT choice_id FROM old)
+            AND {table}.choice_id <> excluded.choice_id
+            RETURNING (SELECT choice_id FROM old)
+        """
+
+    def cast_many(self, votes):
+        """
+        Record a batch of (user_id, question_id, choice_id) votes given
+        in submission order. The last vote of each user on a question
+        wins. Returns the number of votes that changed.
+        """
+        latest = {}
+        for user_id, question_id, choice_id in votes:
+            latest[user_id, question_id] = choice_id
+        if not latest:
+            return 0
+        user_ids = {user_id for user_id, _ in latest}
+        question_ids = {question_id for _, question_id in latest}
+        with transaction.atomic():
+            # The filter also matches other votes of these users on these
+            # questions, so read plain rows and keep only the batch's own
+            existing = {
+                (user_id, question_id): (pk, choice_id)
+                for pk, user_id, question_id, choice_id
+                in self.select_for_update().filter(
+                    user_id__in=user_ids,
+                    question_id__in=question_ids,
+                ).values_list('id', 'user_id', 'question_id', 'choice_id')
+                if (user_id, question_id) in latest
+            }
+            created, updated, changes = [], [], []
+            now = timezone.now()
+            for (user_id, question_id), choice_id in latest.items():
+                if (user_id, question_id) not in existing:
+                    created.append(Vote(
+                        user_id=user_id,
+                        question_id=question_id,
+                        choice_id=choice_id,
+                    ))
+                    changes.append((question_id, None, choice_id))
+                    continue
+                pk, previous_choice_id = existing[user_id, question_id]
+                if previous_choice_id != choice_id:
+                    changes.append((question_id, previous_choice_id, choice_id))
+                    updated.append(
+                        Vote(pk=pk, choice_id=choice_id, updated=now)
+                    )
+            self.bulk_create(created)
+            self.bulk_update(updated, ['choice', 'updated'])
+            apply_vote_changes(changes)
+        return len(changes)
+
+    def restore_many(self, votes) -> int:
+        """
+        Insert a batch of (user_id, question_id, choice_id, created,
+        updated) votes, such as exported ones, by users who have not
+        voted on these questions yet, keeping their timestamps. Counters
+        are updated as by cast_many(), but each vote is added to the
+        rollup of the minute it was created in rather than the current
+        one. Returns the number of votes inserted.
+        """
+        latest = {}
+        for user_id, question_id, choice_id, created, updated in votes:
+            latest[user_id, question_id] = (choice_id, created, updated)
+        if not latest:
+            return 0
+        with transaction.atomic():
+            self.bulk_create([
+                Vote(
+                    user_id=user_id, question_id=question_id,
+                    choice_id=choice_id, created=created, updated=updated,
+                )
+                for (user_id, question_id), (choice_id, created, updated)
+                in latest.items()
+            ])
+            apply_vote_changes([
+                (question_id, None, choice_id)
+                for (_, question_id), (choice_id, _, _) in latest.items()
+            ], rollups=False)
+            VoteRollup.objects.add_counts(Counter(
+                (question_id, choice_id, bucket_start(created, MINUTE))
+                for (_, question_id), (choice_id, created, _)
+                in latest.items()
+            ))
+        return len(latest)
+
+
 class Vote(models.Model):
     """ Records a vote of a Choice ny a User. """
     user = models.ForeignKey('auth.User', on_delete=models.CASCADE)
     choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    created = models.DateTimeField(default=timezone.now, editable=False)
+    updated = models.DateTimeField(default=timezone.now, editable=False)
+
+    objects = VoteManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'question'],
+                name='unique_vote_per_user_question',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.question_id is None and self.choice_id is not None:
+            self.question_id = self.choice.question_id
+        super().save(*args, **kwargs)
 
     def __str__(self) -> str:
         return f"{self.user.username} voted for {self.choice.choice_text}"
+
+
+MINUTE = 60
+HOUR = 3600
+
+
+def bucket_start(moment, resolution) -> datetime.datetime:
+    """Return the start (in UTC) of the `resolution` second bucket."""
+    timestamp = int(moment.timestamp()) // resolution * resolution
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+
+
+class VoteRollupManager(models.Manager):
+    """
+    Manager for the per-choice vote rollups, which record how many votes
+    each choice gained or lost in every minute, or in every hour once
+    compacted, so timelines never have to read the Vote table.
+    """
+
+    def _add(self, resolution, bucket, deltas, question_of, shard=0):
+        deltas = {pk: delta for pk, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        # Create missing rows first, so that concurrent votes in a new
+        # bucket all add to the same row instead of racing to insert it
+        self.bulk_create([
+            VoteRollup(
+                question_id=question_of[choice_id], choice_id=choice_id,
+                resolution=resolution, bucket=bucket, shard=shard,
+            )
+            for choice_id in deltas
+        ], ignore_conflicts=True)
+        _add_to_counters(
+            self.filter(resolution=resolution, bucket=bucket, shard=shard),
+            'votes', deltas, key='choice_id',
+        )
+
+    def record(self, deltas, question_of, when=None, shard_of=None):
+        """
+        Add `deltas` (choice id -> change in votes) to the minute bucket
+        of `when` (by default now). `question_of` maps each choice id to
+        its question id. Questions in `shard_of` have their votes added
+        to the rows of the shard it maps them to, like their counters.
+        """
+        bucket = bucket_start(when or timezone.now(), MINUTE)
+        by_shard = {}
+        for choice_id, delta in deltas.items():
+            shard = (shard_of or {}).get(question_of[choice_id], 0)
+            by_shard.setdefault(shard, {})[choice_id] = delta
+        for shard, shard_deltas in by_shard.items():
+            self._add(MINUTE, bucket, shard_deltas, question_of, shard)
+
+    def add_counts(self, counts):
+        """
+        Add `counts` ((question_id, choice_id, bucket) -> votes) to the
+        minute rollups of those buckets, whatever minutes they span, in
+        a fixed number of statements.
+        """
+        counts = {key: votes for key, votes in counts.items() if votes}
+        if not counts:
+            return
+        with transaction.atomic():
+            self.bulk_create([
+                VoteRollup(
+                    question_id=question_id, choice_id=choice_id,
+                    resolution=MINUTE, bucket=bucket,
+                )
+                for question_id, choice_id, bucket in counts
+            ], ignore_conflicts=True)
+            votes_of = {
+                (choice_id, bucket): votes
+                for (_, choice_id, bucket), votes in counts.items()
+            }
+            rows = self.filter(
+                resolution=MINUTE, shard=0,
+                choice_id__in={choice_id for choice_id, _ in votes_of},
+                bucket__in={bucket for _, bucket in votes_of},
+            ).values_list('pk', 'choice_id', 'bucket')
+            _add_to_counters(self.all(), 'votes', {
+                pk: votes_of[choice_id, bucket]
+                for pk, choice_id, bucket in rows
+                if (choice_id, bucket) in votes_of
+            })
+
+    def compact(self, before) -> int:
+        """
+        Fold the minute rollups of every hour that ended by `before`
+        into hour rollups. Returns the number of minute rows folded.
+        """
+        cutoff = bucket_start(before, HOUR)
+        with transaction.atomic():
+            minutes = self.filter(resolution=MINUTE, bucket__lt=cutoff)
+            hours = {}
+            question_of = {}
+            for question_id, choice_id, bucket, votes in minutes.values_list(
+                'question_id', 'choice_id', 'bucket', 'votes'
+            ).iterator():
+                deltas = hours.setdefault(bucket_start(bucket, HOUR), Counter())
+                deltas[choice_id] += votes
+                question_of[choice_id] = question_id
+            for hour, deltas in hours.items():
+                self._add(HOUR, hour, deltas, question_of)
+            folded, _ = minutes.delete()
+        return folded
+
+    def timeline(self, question_id, resolution=HOUR):
+        """
+        Return the buckets of a question's rollups, oldest first, as
+        (start, {choice id: change in votes}) pairs. Hourly timelines
+        also fold in the minutes not compacted yet; minute timelines
+        show compacted periods by the hour, and so does an hour that
+        holds votes from before rollups were kept.
+        """
+        rollups = self.filter(question_id=question_id)
+        if resolution == HOUR:
+            rows = rollups.annotate(
+                start=Trunc('bucket', 'hour', tzinfo=datetime.timezone.utc)
+            ).values('start', 'choice_id').annotate(
+                net=Sum('votes')
+            ).order_by('start', 'choice_id').values_list(
+                'start', 'choice_id', 'net'
+            )
+        else:
+            rows = rollups.order_by('bucket', 'choice_id').values_list(
+                'bucket', 'choice_id', 'votes'
+            )
+        buckets = {}
+        for start, choice_id, votes in rows:
+            bucket = buckets.setdefault(start, {})
+            bucket[choice_id] = bucket.get(choice_id, 0) + votes
+        return list(buckets.items())
+
+
+class VoteRollup(models.Model):
+    """ Change in the votes of a Choice during one minute or hour. """
+    RESOLUTIONS = [(MINUTE, 'minute'), (HOUR, 'hour')]
+
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    resolution = models.PositiveIntegerField(choices=RESOLUTIONS)
+    bucket = models.DateTimeField()
+    shard = models.PositiveSmallIntegerField(default=0)
+    votes = models.IntegerField(default=0)
+
+    objects = VoteRollupManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['choice', 'resolution', 'bucket', 'shard'],
+                name='unique_rollup_per_choice_bucket_shard',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['question', 'bucket'], name='rollup_question_bucket'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.choice_id} {self.get_resolution_display()} {self.bucket}"
+
+
+class ChoiceVoteShardManager(models.Manager):
+    """
+    Manager for the counter shards of questions with counter_shards > 1.
+    Each shard holds the change in a choice's votes since the shards
+    were last folded into Choice.votes and Question.total_votes.
+    """
+
+    def add(self, deltas, question_of, shard_of):
+        """
+        Add `deltas` (choice id -> change in votes) to the shard that
+        `shard_of` gives for each choice's question.
+        """
+        by_shard = {}
+        for choice_id, delta in deltas.items():
+            if delta:
+                shard = shard_of[question_of[choice_id]]
+                by_shard.setdefault(shard, {})[choice_id] = delta
+        for shard, shard_deltas in by_shard.items():
+            self.bulk_create([
+                ChoiceVoteShard(
+                    question_id=question_of[choice_id], choice_id=choice_id,
+                    shard=shard,
+                )
+                for choice_id in shard_deltas
+            ], ignore_conflicts=True)
+            _add_to_counters(
+                self.filter(shard=shard), 'votes', shard_deltas,
+                key='choice_id',
+            )
+
+    def compact(self, question_ids=None) -> set:
+        """
+        Fold the shards (of the questions in `question_ids`, or all) into
+        the Choice and Question counters. The folded amounts are taken
+        off the shards rather than deleting them, so votes added in the
+        meantime are kept. Returns the ids of the questions folded.
+        """
+        with transaction.atomic():
+            shards = self.select_for_update().exclude(votes=0)
+            if question_ids is not None:
+                shards = shards.filter(question_id__in=question_ids)
+            choice_deltas = Counter()
+            question_deltas = Counter()
+            folded = {}
+            for pk, question_id, choice_id, votes in shards.values_list(
+                'pk', 'question_id', 'choice_id', 'votes'
+            ):
+                choice_deltas[choice_id] += votes
+                question_deltas[question_id] += votes
+                folded[pk] = -votes
+            _add_to_counters(Choice.objects, 'votes', choice_deltas)
+            _add_to_counters(Question.objects, 'total_votes', question_deltas)
+            _add_to_counters(self.all(), 'votes', folded)
+        return set(question_deltas)
+
+
+class ChoiceVoteShard(models.Model):
+    """ Votes of a Choice not yet folded into its counter, in one shard. """
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    votes = models.IntegerField(default=0)
+
+    objects = ChoiceVoteShardManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['choice', 'shard'], name='unique_shard_per_choice',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.choice_id} shard {self.shard}"
@@ -0,0 +1,231 @@
+"""
+Keyset pagination of the poll index.
+
+Pages are ordered newest first by (pub_date, id) and each page after
+the first starts below the last question of the page before it. The
+position is carried in an opaque cursor, so a page is found with one
+index seek however deep it is, and no COUNT query is needed: one row
+beyond the page size is fetched to tell whether another page follows.
+
+EstimatedCountPaginator serves the admin, whose changelists need a
+total: for large unfiltered tables it takes the row count from the
+database's statistics instead of counting every row.
+"""
+import base64
+import binascii
+import datetime
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, transaction
+from django.http import Http404
+from django.utils.functional import cached_property
+
+from .models import Question
+
+# Filters of the index page: name -> (QuestionQuerySet method, staff only)
+STATUSES = {
+    '': ('published', False),
+    'open': ('open', False),
+    'closed': ('closed', False),
+    'upcoming': ('upcoming', True),
+}
+
+
+def encode_cursor(question) -> str:
+    """Return the cursor of the page that follows `question`."""
+    position = f'{question.pub_date.isoformat()}|{question.pk}'
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Return the (pub_date, id) position encoded in `cursor`.
+    Raises BadRequest if the cursor was not made by encode_cursor().
+    """
+    try:
+        position = base64.urlsafe_b64decode(
+            cursor + '=' * (-len(cursor) % 4)
+        ).decode()
+        pub_date, pk = position.split('|')
+        pub_date = datetime.datetime.fromisoformat(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise BadRequest("Invalid page cursor.")
+    if pub_date.tzinfo is None:
+        raise BadRequest("Invalid page cursor.")
+    return pub_date, pk
+
+
+class KeysetPage:
+    """
+    One page of questions. The rows are loaded on first use, so a page
+    whose rendering is served from the cache costs no query.
+    """
+
+    def __init__(self, queryset, page_size, params=None):
+        self.queryset = queryset[:page_size + 1]
+        self.page_size = page_size
+        self.params = params or {}
+
+    @cached_property
+    def rows(self):
+        return list(self.queryset)
+
+    async def aload(self):
+        """Load the rows with the async ORM."""
+        if 'rows' not in self.__dict__:
+            self.rows = [question async for question in self.queryset]
+        return self
+
+    @property
+    def object_list(self):
+        return self.rows[:self.page_size]
+
+    @property
+    def has_next(self) -> bool:
+        return len(self.rows) > self.page_size
+
+    @property
+    def next_cursor(self):
+        if not self.has_next:
+            return None
+        return encode_cursor(self.object_list[-1])
+
+    @property
+    def is_first(self) -> bool:
+        return 'cursor' not in self.params
+
+    @property
+    def query(self) -> str:
+        """Query string of this page."""
+        return urlencode(self.params)
+
+    @property
+    def next_query(self) -> str:
+        """Query string of the next page."""
+        return urlencode({**self.params, 'cursor': self.next_cursor})
+
+    @property
+    def first_query(self) -> str:
+        """Query string of the first page with the same filter."""
+        return urlencode({
+            key: value for key, value in self.params.items()
+            if key != 'cursor'
+        })
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def paginate(queryset, cursor=None, page_size=None, params=None):
+    """
+    Return the KeysetPage of `queryset` that starts after `cursor`,
+    ordered newest first.
+    """
+    if page_size is None:
+        page_size = settings.POLLS_INDEX_PAGE_SIZE
+    queryset = queryset.order_by('-pub_date', '-id')
+    if cursor:
+        pub_date, pk = decode_cursor(cursor)
+        # Equivalent to (pub_date, id) < (cursor), written so that the
+        # database seeks the pub_date index instead of scanning it. The
+        # cursor bound comes before the filters of `queryset`, because
+        # SQLite seeks with the first of several bounds on a column.
+        queryset = queryset.model.objects.filter(
+            pub_date__lte=pub_date
+        ).exclude(pub_date=pub_date, id__gte=pk) & queryset
+    return KeysetPage(queryset, page_size, params)
+
+
+def page_size_from(value) -> int:
+    """Parse a requested page size, limited to POLLS_INDEX_MAX_PAGE_SIZE."""
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        return settings.POLLS_INDEX_PAGE_SIZE
+    return max(1, min(page_size, settings.POLLS_INDEX_MAX_PAGE_SIZE))
+
+
+def is_staff_only(query) -> bool:
+    """Return True if the `query` asks for a filter only staff may see."""
+    return STATUSES.get(query.get('status', ''), (None, False))[1]
+
+
+def index_page(query, user=None):
+    """
+    Return the index page requested by the `query` parameters: the
+    `status` filter, the `page_size` and the `cursor`.
+    Raises Http404 for a filter the `user` may not see. The user is
+    only looked at for such filters, so other pages do not depend on it.
+    """
+    status = query.get('status', '')
+    if status not in STATUSES:
+        raise BadRequest("Unknown poll status.")
+    method, staff_only = STATUSES[status]
+    if staff_only and not (user is not None and user.is_staff):
+        raise Http404("No polls found matching the query")
+
+    params = {}
+    if status:
+        params['status'] = status
+    page_size = page_size_from(query.get('page_size'))
+    if page_size != settings.POLLS_INDEX_PAGE_SIZE:
+        params['page_size'] = page_size
+    cursor = query.get('cursor')
+    if cursor:
+        params['cursor'] = cursor
+    queryset = getattr(Question.objects, method)()
+    return paginate(queryset, cursor, page_size, params)
+
+
+def estimate_count(queryset):
+    """
+    Return the number of rows in the table of an unfiltered `queryset`
+    as estimated by the database statistics (PostgreSQL's pg_class, or
+    sqlite_stat1 once ANALYZE has run), or None if there is no estimate.
+    """
+    if queryset.query.where:
+        return None
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = "SELECT reltuples FROM pg_class WHERE oid = %s::regclass"
+    elif connection.vendor == 'sqlite':
+        sql = "SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1"
+    else:
+        return None
+    try:
+        # A savepoint, so a failed lookup leaves the transaction usable
+        with transaction.atomic(using=queryset.db):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [table])
+                row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None:
+        return None
+    # sqlite_stat1 starts with the row count, followed by index stats
+    estimate = int(float(str(row[0]).split()[0]))
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that trusts the estimated row count of a large unfiltered
+    table, so paging a changelist of millions of rows needs no COUNT(*).
+    Smaller or filtered lists are counted exactly.
+    """
+    threshold = 100000
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is not None and estimate >= self.threshold:
+            return estimate
+        return super().count
@@ -0,0 +1,142 @@
+"""
+Read replicas: reads of the heavy poll pages go to a replica, writes and
+everything else to the primary ('default').
+
+Views decorated with replica_reads() read from one of the aliases in
+DATABASE_REPLICAS. After a visitor writes (any POST, such as a vote),
+PrimaryStickinessMiddleware sets a short-lived cookie that keeps their
+reads on the primary for REPLICA_STICKY_SECONDS, so they see their own
+vote even while the replica lags behind.
+"""
+import asyncio
+import contextvars
+import functools
+import random
+import sqlite3
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+STICKY_COOKIE = 'primary_until'
+
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+
+
+def reading_from_replica() -> bool:
+    """Return True if reads are currently routed to a replica."""
+    return _use_replica.get() and bool(settings.DATABASE_REPLICAS)
+
+
+class ReplicaRouter:
+    """
+    Route reads to a random replica inside replica_reads() views and
+    writes to the primary; other reads are left to Django (the primary,
+    or the database an instance was loaded from). Replicas hold the same
+    data, so relations between objects of any alias are allowed, and
+    only the primary is migrated.
+    """
+
+    def db_for_read(self, model, **hints):
+        if reading_from_replica():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+def is_sticky(request) -> bool:
+    """Return True if the visitor wrote recently and must read the primary."""
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def replica_reads(view):
+    """
+    Decorate a view (sync or async) so that its reads go to a replica,
+    unless the visitor wrote within the last REPLICA_STICKY_SECONDS.
+    Template responses are rendered here, while the replica is in use.
+    """
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            token = _use_replica.set(not is_sticky(request))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+        return wrapped
+
+    @functools.wraps(view)
+    def wrapped(request, *args, **kwargs):
+        token = _use_replica.set(not is_sticky(request))
+        try:
+            response = view(request, *args, **kwargs)
+            if not getattr(response, 'is_rendered', True):
+                response.render()
+            return response
+        finally:
+            _use_replica.reset(token)
+    return wrapped
+
+
+class PrimaryStickinessMiddleware:
+    """
+    After a request that may have written (any unsafe method), keep the
+    visitor's reads on the primary for REPLICA_STICKY_SECONDS. The
+    deadline is kept in a cookie rather than the session, so pages that
+    are shared by all visitors do not need to read the session.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.stick(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.stick(request, await self.get_response(request))
+
+    @staticmethod
+    def stick(request, response):
+        """Set the cookie that keeps a visitor who wrote on the primary."""
+        if (request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+                and settings.DATABASE_REPLICAS
+                and response.status_code < 500):
+            seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                STICKY_COOKIE, f'{time.time() + seconds:.3f}',
+                max_age=seconds, httponly=True, samesite='Lax',
+            )
+        return response
+
+
+def refresh_snapshot(source, path) -> None:
+    """
+    Copy the SQLite database of the `source` connection into the file at
+    `path`, in place, with SQLite's online backup. Readers of the snapshot
+    see either the old copy or the new one, never a partial copy.
+    """
+    # The copy would wait forever for a transaction of its own connection
+    source.validate_no_atomic_block()
+    source.ensure_connection()
+    target = sqlite3.connect(path, timeout=30)
+    try:
+        source.connection.backup(target)
+    finally:
+        target.close()
@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import cache, tally
+from .models import (
+    Choice, Question, Vote, apply_vote_changes, remove_choice_votes,
+    vote_cast,
+)
+
+
+def _deleted_with(origin, model, pk) -> bool:
+    """Return True if the delete started at `origin` removes `model` `pk`."""
+    if isinstance(origin, model):
+        return origin.pk == pk
+    if isinstance(origin, QuerySet) and origin.model is model:
+        return origin.filter(pk=pk).exists()
+    return False
+
+
+@receiver(vote_cast)
+def invalidate_on_vote_cast(sender, question_id, **kwargs):
+    # Only the results change; the index and the question's details and
+    # choices stay cached
+    cache.invalidate(question_id)
+
+
+@receiver(vote_cast)
+def update_shared_tally(sender, changes, **kwargs):
+    if settings.POLLS_SHARED_TALLY:
+        transaction.on_commit(lambda: tally.record(changes))
+
+
+@receiver(post_delete, sender=Vote)
+def uncount_deleted_vote(sender, instance, origin=None, **kwargs):
+    # A vote deleted on its own, e.g. with its user, is counted down like
+    # a change; one deleted with its choice or question goes with them
+    if not (_deleted_with(origin, Question, instance.question_id)
+            or _deleted_with(origin, Choice, instance.choice_id)):
+        apply_vote_changes(
+            [(instance.question_id, instance.choice_id, None)]
+        )
+
+
+@receiver(pre_delete, sender=Choice)
+def uncount_deleted_choice(sender, instance, origin=None, **kwargs):
+    if not _deleted_with(origin, Question, instance.question_id):
+        remove_choice_votes(instance.pk)
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def invalidate_question_choices(sender, instance, **kwargs):
+    cache.invalidate(instance.question_id)
+    cache.invalidate(cache.choices_scope(instance.question_id))
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_question(sender, instance, **kwargs):
+    cache.invalidate(instance.pk)
+    cache.invalidate(cache.choices_scope(instance.pk))
+    cache.invalidate(cache.INDEX)
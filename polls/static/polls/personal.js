@@ -0,0 +1,52 @@
+// Fill the parts of a shared poll page that belong to the visitor:
+// the login links, the greeting, the CSRF token of the vote form, the
+// flash messages and the visitor's previous choice.
+(function () {
+    const script = document.currentScript;
+    let url = script.dataset.meUrl;
+    if (script.dataset.question) {
+        url += "?question=" + encodeURIComponent(script.dataset.question);
+    }
+
+    function show(condition, visible) {
+        for (const element of document.querySelectorAll(`[data-when="${condition}"]`)) {
+            element.hidden = !visible;
+        }
+    }
+
+    fetch(url, {credentials: "same-origin", headers: {Accept: "application/json"}})
+        .then((response) => response.json())
+        .then((me) => {
+            const authenticated = me.username !== null;
+            show("authenticated", authenticated);
+            show("anonymous", !authenticated);
+            show("staff", me.is_staff);
+            for (const element of document.querySelectorAll('[data-me="username"]')) {
+                element.textContent = me.username || "";
+            }
+            for (const input of document.querySelectorAll('input[name="csrfmiddlewaretoken"]')) {
+                input.value = me.csrf_token;
+            }
+            if (me.previous_choice !== null) {
+                const radio = document.querySelector(
+                    `input[name="choice"][value="${me.previous_choice}"]`
+                );
+                if (radio) {
+                    radio.checked = true;
+                }
+            }
+            const container = document.querySelector("div.messages");
+            if (container && me.messages.length) {
+                const list = container.querySelector("ul");
+                for (const message of me.messages) {
+                    const item = document.createElement("li");
+                    if (message.tags) {
+                        item.className = message.tags;
+                    }
+                    item.textContent = message.text;
+                    list.appendChild(item);
+                }
+                container.hidden = false;
+            }
+        });
+})();
@@ -0,0 +1,274 @@
+"""
+Vote tallies shared by the worker processes of one host.
+
+When POLLS_SHARED_TALLY is on, the vote counts of the choices of open
+polls are kept in a block of shared memory, named by
+POLLS_SHARED_TALLY_NAME, that every worker maps. Votes add to it once
+they commit. The results pages and the live tallies then read the
+counts in place instead of querying. A worker reloads the counts from
+the database when it first maps the block. After that, the vote path
+reloads them every POLLS_SHARED_TALLY_RECONCILE seconds, which also
+repairs any drift from votes that committed during a reload.
+
+The block holds a header of 64-bit words, then POLLS_SHARED_TALLY_SLOTS
+choice ids (0 for a free slot) and as many counts. A choice is stored at
+its id modulo the number of slots, or the next free slot after it.
+Writers take an flock() on a lock file. They make the sequence word odd
+while they write, so readers can retry instead of reading half an update.
+"""
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from . import cache
+from .models import Choice, Question
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Header words
+MAGIC, SLOTS, SEQUENCE, RECONCILED = range(4)
+HEADER = 4
+MAGIC_NUMBER = 0x6B75706F6C6C73
+WORD = 8
+
+# Share of the slots used, which keeps the probe sequences short
+MAX_LOAD = 0.75
+# Reads retried while writers are busy, before falling back to the database
+READ_ATTEMPTS = 1000
+
+
+class SharedTally:
+    """Vote counts per choice in the shared memory block `name`."""
+
+    def __init__(self, name, slots):
+        if fcntl is None:
+            raise ImproperlyConfigured(
+                "POLLS_SHARED_TALLY needs fcntl (a Unix host)."
+            )
+        self.name = name
+        self._thread_lock = threading.Lock()
+        self._lock_file = open(
+            os.path.join(tempfile.gettempdir(), f'{name}.lock'), 'a+b'
+        )
+        with self._locked():
+            try:
+                self.memory = shared_memory.SharedMemory(name)
+                created = False
+            except FileNotFoundError:
+                self.memory = shared_memory.SharedMemory(
+                    name, create=True, size=(HEADER + 2 * slots) * WORD
+                )
+                created = True
+            # The block must outlive this process, which the resource
+            # tracker would otherwise unlink it with
+            resource_tracker.unregister(self.memory._name, 'shared_memory')
+            self.words = self.memory.buf.cast('q')
+            if created:
+                self.words[SLOTS] = slots
+                self.words[MAGIC] = MAGIC_NUMBER
+            elif self.words[MAGIC] != MAGIC_NUMBER:
+                raise ImproperlyConfigured(
+                    f"Shared memory {name!r} does not hold a vote tally."
+                )
+        self.slots = self.words[SLOTS]
+
+    @contextmanager
+    def _locked(self):
+        # flock() excludes other processes, the lock other threads
+        with self._thread_lock:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _writing(self):
+        with self._locked():
+            if self.words[SEQUENCE] % 2:
+                # A writer died halfway; its lock is gone but not the mark
+                self.words[SEQUENCE] += 1
+            self.words[SEQUENCE] += 1
+            try:
+                yield
+            finally:
+                self.words[SEQUENCE] += 1
+
+    def _find(self, choice_id) -> int:
+        """
+        Return the slot of `choice_id`, or the free slot where it would
+        go, or -1 when it is not stored and no slot is free.
+        """
+        words = self.words
+        start = choice_id % self.slots
+        for probe in range(self.slots):
+            slot = (start + probe) % self.slots
+            if words[HEADER + slot] in (choice_id, 0):
+                return slot
+        return -1
+
+    def counts(self, choice_ids):
+        """
+        Return {choice id: votes} of `choice_ids`, or None when any of
+        them is not tracked or no stable read was possible. Reads never
+        wait for the lock.
+        """
+        words = self.words
+        for attempt in range(READ_ATTEMPTS):
+            sequence = words[SEQUENCE]
+            if sequence % 2 == 0:
+                counts = {}
+                for choice_id in choice_ids:
+                    slot = self._find(choice_id)
+                    if slot < 0 or words[HEADER + slot] != choice_id:
+                        counts = None
+                        break
+                    counts[choice_id] = words[HEADER + self.slots + slot]
+                if words[SEQUENCE] == sequence:
+                    return counts
+            time.sleep(0)
+        return None
+
+    def add(self, deltas) -> None:
+        """
+        Add `deltas` (choice id -> change in votes) to the tracked
+        choices. Others are left for the next reconcile to load.
+        """
+        with self._writing():
+            for choice_id, delta in deltas.items():
+                slot = self._find(choice_id)
+                if slot >= 0 and self.words[HEADER + slot] == choice_id:
+                    self.words[HEADER + self.slots + slot] += delta
+
+    def apply(self, changes) -> None:
+        """
+        Add votes as sent with vote_cast, a list of (previous_choice_id,
+        choice_id) pairs, and reconcile if it is due.
+        """
+        deltas = {}
+        for previous_choice_id, choice_id in changes:
+            if choice_id is not None:
+                deltas[choice_id] = deltas.get(choice_id, 0) + 1
+            if previous_choice_id is not None:
+                deltas[previous_choice_id] = (
+                    deltas.get(previous_choice_id, 0) - 1
+                )
+        self.add(deltas)
+        self.reconcile_if_due()
+
+    def reconcile(self) -> int:
+        """
+        Replace the tracked choices with those of the open polls and
+        their counts in the database. Returns the number of choices.
+        """
+        with self._locked():
+            self.words[RECONCILED] = int(time.time() * 1000)
+        # The newest choices, if there are more than fit
+        rows = list(Choice.objects.filter(
+            question__in=Question.objects.open()
+        ).tallied().order_by('-pk').values_list(
+            'id', 'tally'
+        )[:int(self.slots * MAX_LOAD)])
+        with self._writing():
+            self.memory.buf[
+                HEADER * WORD:(HEADER + 2 * self.slots) * WORD
+            ] = bytes(2 * self.slots * WORD)
+            for choice_id, votes in rows:
+                slot = self._find(choice_id)
+                self.words[HEADER + slot] = choice_id
+                self.words[HEADER + self.slots + slot] = votes
+        return len(rows)
+
+    def reconcile_if_due(self) -> bool:
+        """
+        Reconcile if no worker did for POLLS_SHARED_TALLY_RECONCILE
+        seconds. The first worker to notice claims it, so a single
+        worker queries at a time.
+        """
+        now = int(time.time() * 1000)
+        interval = settings.POLLS_SHARED_TALLY_RECONCILE * 1000
+        with self._locked():
+            due = now - self.words[RECONCILED] >= interval
+            if due:
+                self.words[RECONCILED] = now
+        if due:
+            self.reconcile()
+        return due
+
+    def close(self) -> None:
+        """Unmap the block in this process."""
+        self.words.release()
+        self.memory.close()
+        self._lock_file.close()
+
+    def unlink(self) -> None:
+        """Remove the block, e.g. once every worker has stopped."""
+        memory = shared_memory.SharedMemory(self.name)
+        memory.unlink()
+        memory.close()
+
+
+_tallies = {}
+_lock = threading.Lock()
+
+
+def get_tally() -> SharedTally:
+    """
+    Return the tally named POLLS_SHARED_TALLY_NAME, mapping it and
+    loading it from the database the first time in this process.
+    """
+    name = settings.POLLS_SHARED_TALLY_NAME
+    with _lock:
+        if name not in _tallies:
+            tally = SharedTally(name, settings.POLLS_SHARED_TALLY_SLOTS)
+            tally.reconcile()
+            _tallies[name] = tally
+        return _tallies[name]
+
+
+def record(changes) -> None:
+    """
+    Add committed votes (see SharedTally.apply) to the tally, unless this
+    process maps it only now: loading it reads them from the database.
+    """
+    with _lock:
+        mapped = settings.POLLS_SHARED_TALLY_NAME in _tallies
+    shared = get_tally()
+    if mapped:
+        shared.apply(changes)
+
+
+def cached_question(pk):
+    """
+    Return the question `pk` with its choices prefetched, or None. It is
+    cached until the question or its choices change, but not on votes.
+    """
+    return cache.get_or_render(
+        'results_question', cache.choices_scope(pk),
+        lambda: Question.objects.prefetch_related('choice_set').filter(
+            pk=pk
+        ).first(),
+    )
+
+
+def tallied_choices(question):
+    """
+    Return the prefetched choices of `question` with their `tally` read
+    from the shared tally, or None if it does not track all of them.
+    """
+    choices = list(question.choice_set.all())
+    counts = get_tally().counts([choice.id for choice in choices])
+    if counts is None:
+        return None
+    for choice in choices:
+        choice.tally = counts[choice.id]
+    return choices
@@ -0,0 +1,258 @@
+"""
+Streaming export and import of polls and votes as JSON Lines or CSV.
+
+Both formats hold one record per line with the fields in FIELDS: all
+questions first, then their choices, then the votes, which name their
+user by username and keep the times they were cast and changed.
+Exports read the tables with iterator(), so memory stays flat however
+many votes there are. Imports insert in chunks with bulk_create, map the
+exported question and choice ids to the new rows in memory, and record
+a checkpoint after every committed chunk so a failed import can be
+resumed where it stopped. Imported votes keep their times, and each chunk
+adds them to the timeline rollups of the minutes they were cast in.
+"""
+import csv
+import json
+import os
+import time
+from collections import Counter
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Choice, Question, Vote
+
+FIELDS = (
+    'model', 'id', 'question', 'choice', 'text', 'pub_date', 'end_date',
+    'user', 'created', 'updated',
+)
+
+
+def export_records(chunk_size=2000):
+    """Yield every question, choice and vote as a record dict."""
+    for pk, text, pub_date, end_date in Question.objects.order_by(
+        'pk'
+    ).values_list(
+        'pk', 'question_text', 'pub_date', 'end_date'
+    ).iterator(chunk_size=chunk_size):
+        yield {
+            'model': 'question', 'id': pk, 'text': text,
+            'pub_date': pub_date.isoformat(),
+            'end_date': end_date.isoformat() if end_date else None,
+        }
+    for pk, question_id, text in Choice.objects.order_by('pk').values_list(
+        'pk', 'question_id', 'choice_text'
+    ).iterator(chunk_size=chunk_size):
+        yield {
+            'model': 'choice', 'id': pk, 'question': question_id,
+            'text': text,
+        }
+    # Grouped by question (the order of its foreign key index), so each
+    # chunk of an import touches few questions
+    for pk, question_id, choice_id, username, created, updated in (
+        Vote.objects.order_by('question_id', 'pk').values_list(
+            'pk', 'question_id', 'choice_id', 'user__username', 'created',
+            'updated',
+        ).iterator(chunk_size=chunk_size)
+    ):
+        yield {
+            'model': 'vote', 'id': pk, 'question': question_id,
+            'choice': choice_id, 'user': username,
+            'created': created.isoformat(), 'updated': updated.isoformat(),
+        }
+
+
+def write_records(records, output, fmt) -> int:
+    """Write `records` to the text stream `output`; return their number."""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(output, FIELDS)
+        writer.writeheader()
+        for count, record in enumerate(records, 1):
+            writer.writerow(record)
+    else:
+        for count, record in enumerate(records, 1):
+            output.write(json.dumps(record) + '\n')
+    return count
+
+
+def read_records(stream, fmt):
+    """Yield the record dicts in the text stream `stream`."""
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield {key: value or None for key, value in row.items()}
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _int(value):
+    return None if value is None else int(value)
+
+
+def _datetime(value):
+    if value is None:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValidationError(f"Invalid date {value!r}.")
+    return parsed
+
+
+class Importer:
+    """
+    Import records in chunks of `chunk_size`, each in one transaction.
+    With a `checkpoint` path, the number of records imported so far and
+    the id maps are saved after every chunk and picked up again by the
+    next Importer given the same path.
+    """
+
+    def __init__(self, chunk_size=2000, checkpoint=None, create_users=False,
+                 progress=None):
+        self.chunk_size = chunk_size
+        self.checkpoint = checkpoint
+        self.create_users = create_users
+        self.progress = progress
+        self.done = 0
+        self.question_ids = {}
+        self.choice_ids = {}
+        self.user_ids = {}
+        self.counts = Counter()
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as checkpoint_file:
+                state = json.load(checkpoint_file)
+            self.done = state['done']
+            self.question_ids = {
+                int(old): new for old, new in state['questions'].items()
+            }
+            self.choice_ids = {
+                int(old): new for old, new in state['choices'].items()
+            }
+
+    def run(self, records) -> Counter:
+        """
+        Import `records`, skipping those a previous run already
+        imported, and return the number of rows imported per model.
+        """
+        self.user_ids = dict(User.objects.values_list('username', 'id'))
+        started = time.perf_counter()
+        chunk = []
+        for position, record in enumerate(records):
+            if position < self.done:
+                continue
+            chunk.append(record)
+            if len(chunk) >= self.chunk_size:
+                self._import_chunk(chunk, started)
+                chunk = []
+        if chunk:
+            self._import_chunk(chunk, started)
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+        return self.counts
+
+    def _import_chunk(self, chunk, started) -> None:
+        questions, choices, votes = [], [], []
+        for record in chunk:
+            model = record.get('model')
+            if model == 'question':
+                questions.append(record)
+            elif model == 'choice':
+                choices.append(record)
+            elif model == 'vote':
+                votes.append(record)
+            else:
+                raise ValidationError(f"Unknown record type {model!r}.")
+
+        with transaction.atomic():
+            if questions:
+                created = Question.objects.bulk_create([
+                    Question(
+                        question_text=record['text'],
+                        pub_date=_datetime(record['pub_date']),
+                        end_date=_datetime(record.get('end_date')),
+                    )
+                    for record in questions
+                ])
+                for record, question in zip(questions, created):
+                    self.question_ids[_int(record['id'])] = question.pk
+            if choices:
+                created = Choice.objects.bulk_create([
+                    Choice(
+                        question_id=self._map(
+                            self.question_ids, record['question'], 'question'
+                        ),
+                        choice_text=record['text'],
+                    )
+                    for record in choices
+                ])
+                for record, choice in zip(choices, created):
+                    self.choice_ids[_int(record['id'])] = choice.pk
+            if votes:
+                self._add_missing_users(votes)
+                now = timezone.now()
+                restored = []
+                for record in votes:
+                    # Exports from before timestamps were kept have none
+                    created = _datetime(record.get('created')) or now
+                    restored.append((
+                        self._map(self.user_ids, record['user'], 'user'),
+                        self._map(
+                            self.question_ids, record['question'], 'question'
+                        ),
+                        self._map(self.choice_ids, record['choice'], 'choice'),
+                        created,
+                        _datetime(record.get('updated')) or created,
+                    ))
+                Vote.objects.restore_many(restored)
+        self.done += len(chunk)
+        self.counts.update(
+            question=len(questions), choice=len(choices), vote=len(votes)
+        )
+        self._save_checkpoint()
+        if self.progress:
+            elapsed = time.perf_counter() - started
+            self.progress(self.done, sum(self.counts.values()) / elapsed)
+
+    def _map(self, ids, key, name):
+        if name != 'user':
+            key = _int(key)
+        try:
+            return ids[key]
+        except KeyError:
+            raise ValidationError(
+                f"Unknown {name} {key!r}; it must be imported before "
+                f"the records that refer to it."
+            )
+
+    def _add_missing_users(self, votes) -> None:
+        if not self.create_users:
+            return
+        missing = {
+            record['user'] for record in votes
+            if record['user'] not in self.user_ids
+        }
+        if missing:
+            User.objects.bulk_create([
+                User(username=username, password=make_password(None))
+                for username in sorted(missing)
+            ])
+            self.user_ids.update(User.objects.filter(
+                username__in=missing
+            ).values_list('username', 'id'))
+
+    def _save_checkpoint(self) -> None:
+        if not self.checkpoint:
+            return
+        partial = f'{self.checkpoint}.tmp'
+        with open(partial, 'w') as checkpoint_file:
+            json.dump({
+                'done': self.done,
+                'questions': self.question_ids,
+                'choices': self.choice_ids,
+            }, checkpoint_file)
+        os.replace(partial, self.checkpoint)
@@ -1,11 +1,36 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import api, async_views, views
 
 app_name = 'polls'
-urlpatterns = [
-    path('', views.IndexView.as_view(), name='index'),
-    path('<int:pk>/', views.DetailView.as_view(), name='detail'),
-    path('<int:pk>/results/', views.ResultsView.as_view(), name='results'),
-    path('<int:question_id>/vote/', views.vote, name='vote'),
+
+if settings.POLLS_ASYNC_VIEWS:
+    urlpatterns = [
+        path('', async_views.index, name='index'),
+        path('<int:pk>/', async_views.detail, name='detail'),
+        path('<int:pk>/results/', async_views.results, name='results'),
+        path('<int:question_id>/vote/', async_views.vote, name='vote'),
+    ]
+    if settings.POLLS_LIVE_RESULTS:
+        urlpatterns.append(path(
+            '<int:pk>/results/live/', async_views.live_results,
+            name='results-live',
+        ))
+else:
+    urlpatterns = [
+        path('', views.IndexView.as_view(), name='index'),
+        path('<int:pk>/', views.DetailView.as_view(), name='detail'),
+        path('<int:pk>/results/', views.ResultsView.as_view(), name='results'),
+        path('<int:question_id>/vote/', views.vote, name='vote'),
+    ]
+
+urlpatterns += [
+    path('me/', views.me, name='me'),
+    path('api/', api.index, name='api-index'),
+    path('api/<int:pk>/', api.detail, name='api-detail'),
+    path('api/<int:pk>/results/', api.results, name='api-results'),
+    path('api/<int:pk>/timeline/', api.timeline, name='api-timeline'),
+    path('export/tallies.csv', views.export_tallies, name='export-tallies'),
+    path('export/votes.csv', views.export_votes, name='export-votes'),
 ]
@@ -1,17 +1,27 @@
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
 from django.views import generic
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.gzip import gzip_page
 # from django.contrib.auth.mixins import LoginRequiredMixin
-from django.contrib.auth.models import AnonymousUser
 from django.shortcuts import redirect
 from django.contrib import messages
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.decorators import method_decorator
+from django.utils.safestring import mark_safe
+from django.views.decorators.cache import never_cache
 
+from . import cache, exports, pagination, routers, tally, vote_queue
 from .models import Choice, Question, Vote
+from django.conf import settings
 from django.utils import timezone
 
 
+@method_decorator(cache.shared_page, name='dispatch')
+@method_decorator(routers.replica_reads, name='dispatch')
 class IndexView(generic.ListView):
     """
     View for displaying the list of the latest published questions.
@@ -21,14 +31,31 @@ class IndexView(generic.ListView):
 
     def get_queryset(self):
         """
-        Return the last five published questions (not including those set to be
-        published in the future).
+        Return the requested page of published questions, newest first
+        (not including those set to be published in the future unless
+        a staff member asks for upcoming polls).
         """
-        return Question.objects.filter(
-            pub_date__lte=timezone.now()
-        ).order_by('-pub_date')[:5]
+        return pagination.index_page(self.request.GET, self.request.user)
+
+    def get_context_data(self, **kwargs):
+        """
+        Add the rendered question list, cached per page until a question
+        changes.
+        """
+        context = super().get_context_data(**kwargs)
+        page = self.object_list
+        context['page'] = page
+        context['question_list'] = mark_safe(cache.get_or_render(
+            'index', cache.INDEX,
+            lambda: render_to_string('polls/index_list.html', context),
+            timeout=settings.POLLS_INDEX_CACHE_TIMEOUT,
+            variant=page.query,
+        ))
+        return context
 
 
+@method_decorator(cache.shared_page, name='dispatch')
+@method_decorator(routers.replica_reads, name='dispatch')
 class DetailView(generic.DetailView):
     """
     View for displaying the details of a specific question.
@@ -38,42 +65,61 @@ class DetailView(generic.DetailView):
 
     def get_queryset(self):
         """
-        Excludes any questions that aren't published yet.
+        Excludes any questions that aren't published yet and fetches
+        their choices along with them.
         """
-        return Question.objects.filter(pub_date__lte=timezone.now())
+        return Question.objects.filter(
+            pub_date__lte=timezone.now()
+        ).prefetch_related('choice_set')
+
+
+@method_decorator(cache.shared_page, name='dispatch')
+@method_decorator(routers.replica_reads, name='dispatch')
+class ResultsView(generic.DetailView):
+    """
+    View for displaying the results of a specific question.
+    """
+    model = Question
+    template_name = 'polls/results.html'
 
-    def get_previous_choice(self):
+    def get_object(self, queryset=None):
         """
-        Get the previous choice made by the user for the current question.
+        With POLLS_SHARED_TALLY, take the question and its choices from
+        the cache, which votes do not invalidate.
         """
-        user = self.request.user
-        if user == AnonymousUser():
-            return None
-
-        question = self.get_object()
-        votes = Vote.objects.filter(choice__question=question, user=user)
-        if votes.exists():
-            return votes.first().choice
-        else:
-            return None
+        if not settings.POLLS_SHARED_TALLY:
+            return super().get_object(queryset)
+        question = tally.cached_question(self.kwargs['pk'])
+        if question is None:
+            raise Http404("No question found matching the query")
+        return question
 
     def get_context_data(self, **kwargs):
         """
-        Get the context data for rendering the template.
+        Add the rendered results table: for open polls with
+        POLLS_SHARED_TALLY, with counts read from shared memory,
+        otherwise cached until the next vote or change to the question.
         """
         context = super().get_context_data(**kwargs)
-        context['previous_choice'] = self.get_previous_choice()
+        choices = None
+        if settings.POLLS_SHARED_TALLY:
+            choices = tally.tallied_choices(self.object)
+        if choices is not None:
+            results_table = render_to_string(
+                'polls/results_table.html', {'choices': choices}
+            )
+        else:
+            results_table = cache.get_or_render(
+                'results', self.object.pk,
+                lambda: render_to_string(
+                    'polls/results_table.html',
+                    {'choices': self.object.choice_set.tallied()}
+                ),
+            )
+        context['results_table'] = mark_safe(results_table)
         return context
 
 
-class ResultsView(generic.DetailView):
-    """
-    View for displaying the results of a specific question.
-    """
-    model = Question
-    template_name = 'polls/results.html'
-
-
 @login_required
 def vote(request, question_id):
     """
@@ -104,22 +150,78 @@ def vote(request, question_id):
         # Always return an HttpResponseRedirect after successfully dealing
         # with POST data. This prevents data from being posted twice if a
         # user hits the Back button.
-        votes = Vote.objects.filter(
-            choice__question=selected_choice.question,
-            user=user
-        )
-        if votes.exists():
-            vote = Vote.objects.get(
-                choice__question=selected_choice.question,
-                user=user
-            )
-            vote.choice = selected_choice
+        if settings.POLLS_VOTE_QUEUE:
+            vote_queue.enqueue(user.id, question.id, selected_choice.id)
         else:
-            vote = Vote(choice=selected_choice, user=user)
-        vote.save()
+            Vote.objects.cast(user, selected_choice)
 
         # Add a success message
         messages.success(request, " Your vote has been recorded! ")
         return HttpResponseRedirect(
             reverse('polls:results', args=(question.id,))
         )
+
+
+@never_cache
+def me(request):
+    """
+    Return the parts of the poll pages that belong to the visitor, which
+    polls/personal.js fills in so the pages themselves can be shared:
+    the username, whether they are staff, a CSRF token for the vote
+    form, their pending messages and, for ?question=<id>, their choice.
+    """
+    user = request.user
+    previous_choice = None
+    question_id = request.GET.get('question', '')
+    if user.is_authenticated and question_id.isdigit():
+        if settings.POLLS_VOTE_QUEUE:
+            # Read your own vote while it waits in the queue
+            previous_choice = vote_queue.get_queue().pending_choice(
+                user.id, int(question_id)
+            )
+        if previous_choice is None:
+            previous_choice = Vote.objects.filter(
+                question_id=question_id, user=user
+            ).values_list('choice_id', flat=True).first()
+    return JsonResponse({
+        'username': user.get_username() if user.is_authenticated else None,
+        'is_staff': user.is_staff,
+        'csrf_token': get_token(request),
+        'messages': [
+            {'text': str(message), 'tags': message.tags}
+            for message in messages.get_messages(request)
+        ],
+        'previous_choice': previous_choice,
+    })
+
+
+def _export_question_ids(request):
+    """Return the ?question= ids to export, or None for every question."""
+    question_ids = request.GET.getlist('question')
+    if not question_ids:
+        return None
+    return [int(pk) for pk in question_ids if pk.isdigit()]
+
+
+@staff_member_required
+@gzip_page
+def export_tallies(request):
+    """
+    Download the vote count of every choice as CSV, compressed with
+    gzip when the client accepts it.
+    """
+    return exports.csv_response(
+        exports.tally_rows(_export_question_ids(request)), 'tallies.csv'
+    )
+
+
+@staff_member_required
+@gzip_page
+def export_votes(request):
+    """
+    Download every vote as CSV, compressed with gzip when the client
+    accepts it.
+    """
+    return exports.csv_response(
+        exports.vote_rows(_export_question_ids(request)), 'votes.csv'
+    )
@@ -0,0 +1,247 @@
+"""
+Write-behind queue for votes.
+
+When POLLS_VOTE_QUEUE is on, the vote view appends validated votes to a
+local SQLite file in WAL mode and returns at once. A background thread
+in each worker process drains the queue into the main database in
+batches with Vote.objects.cast_many(). The flush_vote_queue command
+drains whatever is left, e.g. before shutdown.
+"""
+import logging
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections
+
+from .models import Choice, Vote
+
+logger = logging.getLogger(__name__)
+
+# Seconds after which a batch claimed by a drainer that never finished
+# (e.g. its process was killed) is drained again
+CLAIM_TIMEOUT = 300
+
+
+class VoteQueue:
+    """
+    Durable FIFO of (user_id, question_id, choice_id) votes stored in a
+    SQLite file that every worker process on the host can share.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=FULL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS pending_vote ('
+                ' seq INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' user_id INTEGER NOT NULL,'
+                ' question_id INTEGER NOT NULL,'
+                ' choice_id INTEGER NOT NULL,'
+                ' claimed REAL)'
+            )
+            columns = {
+                row[1] for row in
+                connection.execute('PRAGMA table_info(pending_vote)')
+            }
+            if 'claimed' not in columns:
+                # A queue file written before batches were claimed
+                connection.execute(
+                    'ALTER TABLE pending_vote ADD COLUMN claimed REAL'
+                )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS pending_vote_user_question'
+                ' ON pending_vote (user_id, question_id, seq)'
+            )
+            self._local.connection = connection
+        return connection
+
+    def put(self, user_id, question_id, choice_id) -> None:
+        """Append a vote to the end of the queue."""
+        self._connection().execute(
+            'INSERT INTO pending_vote (user_id, question_id, choice_id)'
+            ' VALUES (?, ?, ?)',
+            (user_id, question_id, choice_id),
+        )
+
+    def pending_choice(self, user_id, question_id):
+        """
+        Return the choice id of the user's newest queued vote on the
+        question, or None if nothing is waiting to be drained.
+        """
+        row = self._connection().execute(
+            'SELECT choice_id FROM pending_vote'
+            ' WHERE user_id = ? AND question_id = ?'
+            ' ORDER BY seq DESC LIMIT 1',
+            (user_id, question_id),
+        ).fetchone()
+        return row[0] if row else None
+
+    def __len__(self) -> int:
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM pending_vote'
+        ).fetchone()[0]
+
+    def _claim(self, batch_size):
+        """
+        Claim the oldest `batch_size` votes for this drainer and return
+        (claim, rows), or (None, []) while another drainer holds a claim,
+        so batches are applied one at a time and in order.
+        """
+        connection = self._connection()
+        claim = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if connection.execute(
+                'SELECT 1 FROM pending_vote WHERE claimed >= ? LIMIT 1',
+                (claim - CLAIM_TIMEOUT,),
+            ).fetchone():
+                rows = []
+            else:
+                rows = connection.execute(
+                    'SELECT seq, user_id, question_id, choice_id'
+                    ' FROM pending_vote ORDER BY seq LIMIT ?',
+                    (batch_size,),
+                ).fetchall()
+                if rows:
+                    connection.execute(
+                        'UPDATE pending_vote SET claimed = ? WHERE seq <= ?',
+                        (claim, rows[-1][0]),
+                    )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return (claim, rows) if rows else (None, [])
+
+    @staticmethod
+    def _valid(rows):
+        """
+        Return the (user_id, question_id, choice_id) votes of `rows` whose
+        user and choice still exist, logging and dropping the others,
+        which would fail the whole batch.
+        """
+        choices = dict(Choice.objects.filter(
+            pk__in={row[3] for row in rows}
+        ).values_list('id', 'question_id'))
+        users = set(get_user_model()._default_manager.filter(
+            pk__in={row[1] for row in rows}
+        ).values_list('pk', flat=True))
+        votes = []
+        for seq, user_id, question_id, choice_id in rows:
+            if user_id in users and choices.get(choice_id) == question_id:
+                votes.append((user_id, question_id, choice_id))
+            else:
+                logger.warning(
+                    "Dropped queued vote %s of user %s for choice %s of "
+                    "question %s, which no longer exists.",
+                    seq, user_id, choice_id, question_id,
+                )
+        return votes
+
+    def drain(self, batch_size=None) -> int:
+        """
+        Move up to `batch_size` of the oldest votes into the database.
+        The batch is claimed first, so the queue is not locked while the
+        database is written and votes can still be queued meanwhile.
+        Votes for deleted users or choices are dropped. Queued rows are
+        removed once the database transaction has committed; a claim
+        left by a drainer that died is taken over after CLAIM_TIMEOUT.
+        Replaying a batch is harmless because applying the same final
+        votes changes nothing. Returns the number of votes taken from
+        the queue, or 0 while another process drains it.
+        """
+        if batch_size is None:
+            batch_size = settings.POLLS_VOTE_QUEUE_BATCH_SIZE
+        claim, rows = self._claim(batch_size)
+        if not rows:
+            return 0
+        connection = self._connection()
+        try:
+            Vote.objects.cast_many(self._valid(rows))
+        except BaseException:
+            # Let the next drain retry the batch
+            connection.execute(
+                'UPDATE pending_vote SET claimed = NULL WHERE claimed = ?',
+                (claim,),
+            )
+            raise
+        connection.execute(
+            'DELETE FROM pending_vote WHERE claimed = ?', (claim,)
+        )
+        return len(rows)
+
+    def flush(self) -> int:
+        """
+        Drain the queue until it is empty, or left to another process
+        that is draining it. Returns the votes moved.
+        """
+        total = 0
+        while True:
+            moved = self.drain()
+            if not moved:
+                return total
+            total += moved
+
+
+class VoteQueueWorker(threading.Thread):
+    """Daemon thread that drains the queue every few seconds."""
+
+    def __init__(self, queue, interval):
+        super().__init__(name='vote-queue-worker', daemon=True)
+        self.queue = queue
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            close_old_connections()
+            try:
+                self.queue.flush()
+            except Exception:
+                logger.exception("Failed to drain the vote queue")
+
+    def stop(self):
+        self.stopped.set()
+
+
+_queues = {}
+_worker = None
+_lock = threading.Lock()
+
+
+def get_queue() -> VoteQueue:
+    """Return the queue stored at POLLS_VOTE_QUEUE_PATH."""
+    path = str(settings.POLLS_VOTE_QUEUE_PATH)
+    with _lock:
+        if path not in _queues:
+            _queues[path] = VoteQueue(path)
+        return _queues[path]
+
+
+def enqueue(user_id, question_id, choice_id) -> None:
+    """
+    Queue a validated vote and make sure this process runs a worker
+    thread, unless POLLS_VOTE_QUEUE_WORKER is off.
+    """
+    global _worker
+    queue = get_queue()
+    queue.put(user_id, question_id, choice_id)
+    if settings.POLLS_VOTE_QUEUE_WORKER and _worker is None:
+        with _lock:
+            if _worker is None:
+                _worker = VoteQueueWorker(
+                    queue, settings.POLLS_VOTE_QUEUE_INTERVAL
+                )
+                _worker.start()